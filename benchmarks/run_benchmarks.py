@@ -0,0 +1,303 @@
+"""
+Benchmarks of the solvers, reporting the rate of moves, the peak memory and
+the best cost over time for each combination of model, platform and solver.
+
+Each benchmark runs in a fresh process with a fixed seed and a time budget,
+and the results are written as JSON, for example:
+
+    python benchmarks/run_benchmarks.py --output benchmarks.json --time-budget 60
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import toml
+import onnx
+from onnx import helper, numpy_helper, TensorProto
+
+# root directory of the repository
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# solvers to benchmark, with the configuration they are run with
+SOLVERS = {
+    "simulated_annealing": "examples/optimiser_example.toml",
+    "improve": "examples/optimiser_example.toml",
+    "greedy_partition": "examples/greedy_partition_throughput.toml",
+    "latency_simulated_annealing": "examples/latency_optimiser_example.toml",
+}
+
+# models to benchmark, either an ONNX file or the parameters of a synthetic model
+MODELS = {
+    "lenet": "examples/models/lenet.onnx",
+    "synthetic_small": { "depth": 4, "channels": 16, "rows": 32 },
+    "synthetic_large": { "depth": 8, "channels": 64, "rows": 64 },
+}
+
+PLATFORMS = [ "zedboard", "zcu102" ]
+
+def get_synthetic_model(path, depth, channels, rows, seed=0):
+    """
+    creates a chain of convolution, relu and pooling layers followed by a
+    fully connected layer, and saves it as an ONNX model
+    """
+    rng = np.random.default_rng(seed)
+    nodes, initializers = [], []
+    # weights of a layer
+    def _weights(name, shape):
+        initializers.append(numpy_helper.from_array(
+            rng.standard_normal(shape).astype(np.float32), name))
+        return name
+    # convolution layers
+    prev, prev_channels, prev_rows = "input", 3, rows
+    for i in range(depth):
+        nodes.append(helper.make_node("Conv",
+            [prev, _weights(f"conv{i}_w", (channels, prev_channels, 3, 3)),
+                _weights(f"conv{i}_b", (channels,))], [f"conv{i}"],
+            name=f"conv{i}", kernel_shape=[3,3], pads=[1,1,1,1], strides=[1,1]))
+        nodes.append(helper.make_node("Relu", [f"conv{i}"], [f"relu{i}"], name=f"relu{i}"))
+        prev, prev_channels = f"relu{i}", channels
+        # downsample every other layer
+        if i % 2 == 1 and prev_rows > 2:
+            nodes.append(helper.make_node("MaxPool", [prev], [f"pool{i}"],
+                name=f"pool{i}", kernel_shape=[2,2], strides=[2,2]))
+            prev, prev_rows = f"pool{i}", prev_rows//2
+    # classifier
+    nodes.append(helper.make_node("Flatten", [prev], ["flatten"], name="flatten", axis=1))
+    nodes.append(helper.make_node("Gemm",
+        ["flatten", _weights("fc_w", (10, prev_channels*prev_rows*prev_rows)),
+            _weights("fc_b", (10,))], ["output"], name="fc", transB=1))
+    # create the model
+    graph = helper.make_graph(nodes, "synthetic",
+            [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 3, rows, rows])],
+            [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, 10])],
+            initializer=initializers)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 11)])
+    onnx.save(onnx.shape_inference.infer_shapes(model), path)
+
+def get_throughput_solver(solver_name, model_path, platform_path, config):
+    """
+    creates a throughput solver, initialised the same way as the command line
+    interface does
+    """
+    from fpgaconvnet.parser.Parser import Parser
+    from fpgaconvnet.tools.layer_enum import from_cfg_type
+    from fpgaconvnet.optimiser.solvers import Improve, SimulatedAnnealing, GreedyPartition
+    import fpgaconvnet.optimiser.transforms.partition
+    import fpgaconvnet.optimiser.transforms.weights_reloading
+
+    # create network
+    net = Parser().onnx_to_fpgaconvnet(model_path, platform_path)
+    net.rsc_allocation = float(config["general"]["resource_allocation"])
+
+    # create the solver
+    annealing = { key: val for key, val in config["annealing"].items() \
+            if key in [ "T", "k", "T_min", "cool" ] }
+    annealing["iterations"] = config["annealing"].get("transform_iterations", 10)
+    if solver_name == "improve":
+        opt = Improve(net, **annealing)
+    elif solver_name == "simulated_annealing":
+        opt = SimulatedAnnealing(net, **annealing)
+    else:
+        opt = GreedyPartition(net, **config.get("greedy_partition", {}))
+    opt.objective = 1
+    opt.net.batch_size = 1
+    opt.transforms = [ transform for transform in config["transforms"] \
+            if config["transforms"][transform]["apply_transform"] ]
+
+    # completely partition graph
+    if config["transforms"]["partition"]["start_complete"]:
+        allowed_partitions = [ (from_cfg_type(a), from_cfg_type(b)) \
+                for a, b in config["transforms"]["partition"]["allowed_partitions"] ]
+        fpgaconvnet.optimiser.transforms.partition.split_complete(
+                opt.net, allowed_partitions if allowed_partitions else None)
+
+    # apply max weights reloading
+    if config["transforms"]["weights_reloading"]["start_max"]:
+        for partition in opt.net.partitions:
+            fpgaconvnet.optimiser.transforms.weights_reloading.apply_max_weights_reloading(partition)
+
+    opt.net.model = None
+    return opt
+
+def get_latency_solver(model_path, platform_path, config):
+    """
+    creates a latency solver, initialised the same way as the command line
+    interface does
+    """
+    from fpgaconvnet.parser.Parser import Parser
+    from fpgaconvnet.tools.layer_enum import from_onnx_op_type
+    from fpgaconvnet.optimiser.latency.solvers import LatencySimulatedAnnealing
+
+    # create network
+    parser = Parser(regression_model=config["general"]["resource_model"],
+            convert_gemm_to_conv=config["general"]["convert_gemm_to_conv"])
+    parser.add_onnx_optimization_passes(config["general"]["optimization_passes"])
+    net = parser.onnx_to_fpgaconvnet(model_path)
+    net.platform.update(platform_path)
+    net.rsc_allocation = float(config["general"]["resource_allocation"])
+
+    # create the solver
+    opt = LatencySimulatedAnnealing(net, objective=0,
+            runtime_parameters=config["general"]["runtime_parameters"],
+            weight_storage=config["general"]["weight_storage"],
+            channel_tiling=config["general"]["channel_tiling"],
+            filter_tiling=config["general"]["filter_tiling"],
+            **config["annealing"])
+    opt.transforms = { transform: config["transforms"][transform]["probability"] \
+            for transform in config["transforms"] \
+            if config["transforms"][transform]["apply_transform"] }
+
+    # transform-specific config
+    opt.combine_nodes = config["transforms"]["combine"]["num_nodes"]
+    opt.combine_discriminate = config["transforms"]["combine"]["discriminate"]
+    opt.seperate_nodes = config["transforms"]["seperate"]["num_nodes"]
+    opt.allowed_seperate_types = [ from_onnx_op_type(_) for _ in \
+            config["transforms"]["seperate"]["allowed_types"] ]
+    opt.shape_method = config["transforms"]["shape"]["method"]
+    opt.use_previous_shape = config["transforms"]["shape"].get("use_previous_shape", True)
+    opt.rand_shape_range = config["transforms"]["shape"].get("rand_shape_range", [5, 5, 5, 5])
+
+    # combine all execution nodes
+    if config["transforms"]["combine"]["start_combine_all"]:
+        layer_types = list(set([ opt.net.graph.nodes[node]["type"] \
+                for node in opt.net.graph.nodes ]))
+        for layer_type in layer_types:
+            for _ in range(100):
+                opt.combine(layer_type, discriminate=opt.combine_discriminate, num_nodes=-1)
+
+    # apply max fine factor
+    if config["transforms"]["fine"]["start_complete"]:
+        for hw_node in opt.building_blocks:
+            opt.apply_random_fine_node(hw_node)
+
+    # set the shapes for hw nodes
+    for hw_node in opt.building_blocks:
+        opt.update_building_block_shape(hw_node,
+                opt.building_blocks[hw_node]["hw"].shape_in(),
+                opt.building_blocks[hw_node]["hw"].shape_out())
+
+    # apply weight storage to building_blocks
+    opt.apply_weight_storage()
+
+    return opt
+
+def run_benchmark(model_name, model_path, platform_name, solver_name, seed, time_budget):
+    """
+    runs a single benchmark, and returns its results. This is executed in
+    a fresh worker process so that the peak memory is for this run only.
+    """
+    # fix the seed
+    random.seed(seed)
+    np.random.seed(seed)
+
+    # load the configuration
+    with open(os.path.join(ROOT, SOLVERS[solver_name]), "r") as f:
+        config = toml.load(f)
+    platform_path = os.path.join(ROOT, "examples/platforms", f"{platform_name}.toml")
+
+    # create the solver
+    if solver_name == "latency_simulated_annealing":
+        opt = get_latency_solver(model_path, platform_path, config)
+        opt.warm_start_time_limit = min(opt.warm_start_time_limit, time_budget)
+    else:
+        opt = get_throughput_solver(solver_name, model_path, platform_path, config)
+
+    # run the solver within the time budget
+    start = time.time()
+    opt.deadline = start + time_budget
+    status = "complete"
+    try:
+        opt.run_solver(log=False)
+    except Exception as error:
+        status = f"error: {error}"
+    wall_time = time.time() - start
+
+    # best cost seen over time
+    profile = opt.profiler.report()
+    best_cost_trace = []
+    for elapsed, cost in profile["trace"]:
+        if not best_cost_trace or cost < best_cost_trace[-1][1]:
+            best_cost_trace.append((elapsed, cost))
+
+    return {
+        "model": model_name,
+        "platform": platform_name,
+        "solver": solver_name,
+        "seed": seed,
+        "time_budget": time_budget,
+        "status": status,
+        "wall_time": wall_time,
+        "moves": profile["moves"],
+        "moves_per_second": profile["moves"]/wall_time if wall_time else 0.0,
+        "acceptance_rate": profile["acceptance_rate"],
+        "peak_memory_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "final_cost": profile["trace"][-1][1] if profile["trace"] else None,
+        "best_cost": best_cost_trace[-1][1] if best_cost_trace else None,
+        "best_cost_trace": best_cost_trace,
+        "phases": profile["phases"],
+    }
+
+def parse_args():
+    """
+    Command line argument parser
+    """
+    parser = argparse.ArgumentParser(description="fpgaConvNet Optimiser Benchmarks")
+    parser.add_argument('-o','--output', metavar='PATH', default="benchmarks.json",
+        help='Path to the results (.json)')
+    parser.add_argument('--models', nargs='+', choices=list(MODELS), default=list(MODELS),
+        help='models to benchmark')
+    parser.add_argument('--platforms', nargs='+', default=PLATFORMS,
+        help='platforms to benchmark, from examples/platforms')
+    parser.add_argument('--solvers', nargs='+', choices=list(SOLVERS), default=list(SOLVERS),
+        help='solvers to benchmark')
+    parser.add_argument('--seed', metavar='n', type=int, default=0,
+        help='seed for all benchmarks')
+    parser.add_argument('--time-budget', metavar='SECONDS', type=float, default=60.0,
+        help='time budget of each benchmark')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as model_dir:
+
+        # get the path of each model, generating the synthetic ones
+        model_paths = {}
+        for model_name in args.models:
+            if isinstance(MODELS[model_name], str):
+                model_paths[model_name] = os.path.join(ROOT, MODELS[model_name])
+            else:
+                model_paths[model_name] = os.path.join(model_dir, f"{model_name}.onnx")
+                get_synthetic_model(model_paths[model_name], seed=args.seed,
+                        **MODELS[model_name])
+
+        # run each benchmark in a new process
+        for model_name in args.models:
+            for platform_name in args.platforms:
+                for solver_name in args.solvers:
+                    print(f"benchmarking {solver_name} on {model_name} ({platform_name})")
+                    with ProcessPoolExecutor(max_workers=1,
+                            mp_context=multiprocessing.get_context("spawn")) as executor:
+                        result = executor.submit(run_benchmark, model_name,
+                                model_paths[model_name], platform_name, solver_name,
+                                args.seed, args.time_budget).result()
+                    print(f"    {result['moves_per_second']:.2f} moves/s, best cost: {result['best_cost']}, "
+                          f"peak memory: {result['peak_memory_kb']} KB ({result['status']})")
+                    results.append(result)
+
+    # save the results
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
+
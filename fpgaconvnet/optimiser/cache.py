@@ -0,0 +1,147 @@
+"""
+Memoisation of the performance and resource models of layers and partitions.
+
+The models are evaluated many times for the same hardware configuration, for
+example when a rejected move restores a previous design. The results are
+stored in a bounded LRU cache, keyed by the hardware parameters of the layers
+they were evaluated on.
+"""
+
+import copy
+import enum
+import numbers
+from collections import OrderedDict
+
+# maximum number of cached results
+CACHE_SIZE = 2**16
+
+# marker for attributes that can't be part of a key
+_UNKEYED = object()
+
+def freeze(val):
+    """
+    converts a parameter into a hashable value that compares by value.
+    Returns `_UNKEYED` for objects such as modules and arrays, which are
+    derived from the other parameters.
+    """
+    if val is None or isinstance(val, (bool, str, numbers.Number, enum.Enum)):
+        return val
+    if isinstance(val, (list, tuple)):
+        vals = tuple(freeze(v) for v in val)
+        return _UNKEYED if _UNKEYED in vals else vals
+    if isinstance(val, dict):
+        vals = tuple((k, freeze(v)) for k, v in sorted(val.items(), key=lambda x: str(x[0])))
+        return _UNKEYED if any(v is _UNKEYED for _, v in vals) else vals
+    return _UNKEYED
+
+def get_attribute_key(obj, exclude=[]):
+    """
+    returns a key of all parameters of an object that can be frozen
+    """
+    key = []
+    for attr, val in vars(obj).items():
+        if attr in exclude:
+            continue
+        val = freeze(val)
+        if val is not _UNKEYED:
+            key.append((attr, val))
+    return tuple(key)
+
+def layer_key(hw):
+    """
+    returns a key of the hardware configuration of a layer, covering its
+    shape, folding factors and all other scalar parameters
+    """
+    return (type(hw).__name__, get_attribute_key(hw))
+
+# attributes of a partition that are solver bookkeeping rather than hardware
+PARTITION_BOOKKEEPING = [ "graph", "dirty", "need_optimise" ]
+
+def partition_key(partition):
+    """
+    returns a key of the hardware configuration of a partition, covering the
+    configuration of each node, the edges and weights reloading. Bookkeeping
+    attributes, such as the dirty flag, are left out so that the same
+    hardware always has the same key.
+    """
+    return (
+        get_attribute_key(partition, exclude=PARTITION_BOOKKEEPING),
+        tuple( (node, layer_key(partition.graph.nodes[node]["hw"])) \
+                for node in partition.graph.nodes ),
+        tuple(partition.graph.edges),
+    )
+
+class ModelCache:
+    """
+    Bounded LRU cache of model results, with hit and miss statistics kept
+    for each kind of result.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = {}
+        self.misses = {}
+
+    def lookup(self, kind, key, evaluate):
+        """
+        returns the cached result for the key, calling `evaluate` to compute
+        it if it is not cached
+        """
+        key = (kind, key)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+            return copy.copy(self.entries[key])
+        self.misses[kind] = self.misses.get(kind, 0) + 1
+        val = evaluate()
+        self.entries[key] = copy.copy(val)
+        # evict the least recently used result
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return val
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = {}
+        self.misses = {}
+
+    def report(self):
+        """
+        prints the hit and miss statistics of the cache
+        """
+        print("model cache statistics:")
+        for kind in sorted(set(self.hits) | set(self.misses)):
+            hits, misses = self.hits.get(kind, 0), self.misses.get(kind, 0)
+            print(f"    {kind:<20} hits: {hits:<10} misses: {misses:<10} hit rate: {hits/(hits+misses):.2%}")
+        print(f"    {len(self.entries)} entries cached (max {self.maxsize})")
+
+# cache shared by the solvers and transforms
+model_cache = ModelCache()
+
+def layer_latency(hw):
+    """
+    cached `hw.latency()`
+    """
+    return model_cache.lookup("layer_latency", layer_key(hw), hw.latency)
+
+def layer_resource_usage(hw):
+    """
+    cached `hw.resource()`
+    """
+    return model_cache.lookup("layer_resources", layer_key(hw), hw.resource)
+
+def partition_latency(partition, freq):
+    """
+    cached `partition.get_latency(freq)`
+    """
+    return model_cache.lookup("partition_latency",
+            (freq, partition_key(partition)), lambda: partition.get_latency(freq))
+
+def partition_resource_usage(partition):
+    """
+    cached `partition.get_resource_usage()`
+    """
+    return model_cache.lookup("partition_resources",
+            partition_key(partition), partition.get_resource_usage)
+
@@ -9,6 +9,7 @@ import toml
 import json
 import argparse
 import shutil
+import time
 import random
 import numpy as np
 import wandb
@@ -21,6 +22,9 @@ from fpgaconvnet.tools.layer_enum import from_cfg_type
 from fpgaconvnet.optimiser.solvers import Improve
 from fpgaconvnet.optimiser.solvers import SimulatedAnnealing
 from fpgaconvnet.optimiser.solvers import GreedyPartition
+from fpgaconvnet.optimiser.solvers import ParallelTempering
+from fpgaconvnet.optimiser.cache import model_cache
+from fpgaconvnet.optimiser.solvers.state import read_checkpoint
 
 import fpgaconvnet.optimiser.transforms.partition
 import fpgaconvnet.optimiser.transforms.coarse
@@ -40,7 +44,7 @@ def main():
         help='Batch size')
     parser.add_argument('--objective', choices=['throughput','latency'], required=True,
         help='Optimiser objective')
-    parser.add_argument('--optimiser', choices=['simulated_annealing', 'improve', 'greedy_partition'],
+    parser.add_argument('--optimiser', choices=['simulated_annealing', 'improve', 'greedy_partition', 'parallel_tempering'],
         default='improve', help='Optimiser strategy')
     parser.add_argument('--optimiser_config_path', metavar='PATH', required=True,
         help='Configuration file (.yml) for optimiser')
@@ -49,10 +53,17 @@ def main():
     parser.add_argument('--seed', metavar='n', type=int, default=random.randint(0,2**32-1),
         help='seed for the optimiser run')
     parser.add_argument('--enable-wandb', action="store_true", help='seed for the optimiser run')
+    parser.add_argument('--resume', metavar='PATH', required=False,
+        help='Checkpoint (or directory of checkpoints) to resume the optimiser run from')
+    parser.add_argument('--time-budget', metavar='SECONDS', type=float, required=False,
+        help='wall-clock time limit for the optimiser run, after which the best design found is kept')
 
     # parse the arguments
     args = parser.parse_args()
 
+    # deadline of the optimiser run
+    deadline = time.time() + args.time_budget if args.time_budget else None
+
     # setup seed
     random.seed(args.seed)
     np.random.seed(args.seed)
@@ -116,7 +127,10 @@ def main():
     elif args.optimiser == "simulated_annealing":
         opt = SimulatedAnnealing(net, **optimiser_config["annealing"])
     elif args.optimiser == "greedy_partition":
-        opt = GreedyPartition(net)
+        opt = GreedyPartition(net, **optimiser_config.get("greedy_partition", {}))
+    elif args.optimiser == "parallel_tempering":
+        opt = ParallelTempering(net, seed=args.seed, **optimiser_config["annealing"],
+                **optimiser_config.get("parallel_tempering", {}))
     else:
         raise RuntimeError(f"optimiser {args.optimiser} not implmented")
 
@@ -165,6 +179,18 @@ def main():
         net.starting_point_distillation(args.teacher_partition_path, not run_optimiser)
         net.update_partitions()
 
+    # save checkpoints of the design during the run
+    if bool(optimiser_config["general"]["checkpoints"]):
+        opt.checkpoint_path = os.path.join(args.output_path,"checkpoint")
+        opt.checkpoints_kept = int(optimiser_config["general"].get("checkpoints_kept", 5))
+
+    # resume from a previous run
+    if args.resume:
+        opt.load_checkpoint(read_checkpoint(args.resume))
+
+    # stop searching at the deadline
+    opt.deadline = deadline
+
     # print("size: ", len(pickle.dumps(opt.net)))
     opt_onnx_model = copy.deepcopy(opt.net.model)
     opt.net.model = None
@@ -172,16 +198,20 @@ def main():
     # run optimiser
     opt.run_solver()
 
+    # merge memory bound partitions, before restoring the model so that
+    # the network stays small to send to the workers
+    if args.optimiser == "greedy_partition":
+        opt.merge_memory_bound_partitions()
+
+    # print the model cache statistics
+    model_cache.report()
+
     # print("size: ", len(pickle.dumps(opt.net)))
     opt.net.model = opt_onnx_model
 
     # update all partitions
     opt.net.update_partitions()
 
-    if args.optimiser == "greedy_partition":
-        opt.merge_memory_bound_partitions()
-        opt.net.update_partitions()
-
     # find the best batch_size
     #if args.objective == "throughput":
     #    net.get_optimal_batch_size()
@@ -189,6 +219,9 @@ def main():
     # create report
     opt.net.create_report(os.path.join(args.output_path,"report.json"))
 
+    # save the profile of the optimiser run
+    opt.profiler.write(os.path.join(args.output_path,"profile.json"))
+
     # save all partitions
     opt.net.save_all_partitions(os.path.join(args.output_path, "config.json"))
 
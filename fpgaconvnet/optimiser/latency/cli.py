@@ -5,8 +5,10 @@ A command line interface for running the optimiser for given networks
 import logging
 import os
 import toml
+import json
 import argparse
 import shutil
+import time
 import random
 import numpy as np
 import wandb
@@ -16,6 +18,7 @@ from fpgaconvnet.parser.Parser import Parser
 from fpgaconvnet.tools.layer_enum import LAYER_TYPE, from_onnx_op_type
 
 from fpgaconvnet.optimiser.latency.solvers import LatencySolver, LatencySimulatedAnnealing
+from fpgaconvnet.optimiser.solvers.state import read_checkpoint
 
 import fpgaconvnet.optimiser.transforms.partition
 import fpgaconvnet.optimiser.transforms.coarse
@@ -46,12 +49,19 @@ def parse_args():
         help='seed for the optimiser run')
     parser.add_argument('--enable-wandb', action="store_true", help='whether to enable wandb logging')
     parser.add_argument('--sweep-wandb', action="store_true", help='whether to enable wandb sweep')
+    parser.add_argument('--resume', metavar='PATH', required=False,
+        help='Checkpoint (or directory of checkpoints) to resume the optimiser run from')
+    parser.add_argument('--time-budget', metavar='SECONDS', type=float, required=False,
+        help='wall-clock time limit for the optimiser run, after which the best design found is kept')
 
     return parser.parse_args()
 
 def optimize():
     args = parse_args()
 
+    # deadline of the optimiser run
+    deadline = time.time() + args.time_budget if args.time_budget else None
+
     # setup seed
     random.seed(args.seed)
     np.random.seed(args.seed)
@@ -217,9 +227,29 @@ def optimize():
     # apply weight storage to building_blocks
     opt.apply_weight_storage()
 
+    # save checkpoints of the design during the run
+    if optimiser_config["general"].get("checkpoints", False):
+        opt.checkpoint_path = os.path.join(args.output_path,"checkpoint")
+        opt.checkpoints_kept = int(optimiser_config["general"].get("checkpoints_kept", 5))
+
+    # resume from a previous run, which is already a valid design
+    if args.resume:
+        opt.load_checkpoint(read_checkpoint(args.resume))
+        opt.warm_start = False
+
+    # stop searching at the deadline
+    opt.deadline = deadline
+
     # run optimiser
     opt.run_solver(log=args.enable_wandb)
 
+    # save the profile of the optimiser run
+    opt.profiler.write(os.path.join(args.output_path,"profile.json"))
+
+    # save the configuration of the best design
+    with open(os.path.join(args.output_path,"config.json"), "w") as f:
+        json.dump(opt.config(), f, indent=2)
+
     # create report
     # opt.net.create_report(os.path.join(args.output_path,"report.json"))
 
@@ -544,6 +544,46 @@ def get_basic_schedule(self, hw_node, exec_node):
     # return the schedule
     return schedule, iteration_space
 
+def get_exec_node_schedule(self, hw_node, exec_node):
+    """
+    returns the schedule and iteration space of a single execution node on
+    the given hardware node
+    """
+    # handle different hardware types
+    match self.net.graph.nodes[exec_node]["type"]:
+        case LAYER_TYPE.Convolution:
+            schedule, iteration_space = \
+                    self.get_convolution_schedule(hw_node, exec_node)
+        case LAYER_TYPE.InnerProduct:
+            schedule, iteration_space = \
+                    self.get_inner_product_schedule(hw_node, exec_node)
+        case LAYER_TYPE.Pooling:
+            schedule, iteration_space = \
+                    self.get_pooling_schedule(hw_node, exec_node)
+        case LAYER_TYPE.ReLU | LAYER_TYPE.Sigmoid | LAYER_TYPE.SiLU:
+            schedule, iteration_space = \
+                    self.get_basic_schedule(hw_node, exec_node)
+        case LAYER_TYPE.EltWise:
+            schedule, iteration_space = \
+                    self.get_basic_schedule(hw_node, exec_node)
+        case LAYER_TYPE.GlobalPooling:
+            schedule, iteration_space = \
+                    self.get_basic_schedule(hw_node, exec_node)
+        case _:
+            raise NotImplementedError(self.net.graph.nodes[exec_node]["type"],
+                    "schedule not implemented")
+
+    # change rows_in, cols_in, depth_in, etc... to rows, cols, depth, ...
+    for i in range(len(schedule)):
+        schedule[i][0]["rows"] = schedule[i][0]["rows_in"]
+        schedule[i][0]["cols"] = schedule[i][0]["cols_in"]
+        schedule[i][0]["channels"] = schedule[i][0]["channels_in"]
+        if "depth_in" in schedule[i][0]:
+            schedule[i][0]["depth"] = schedule[i][0]["depth_in"]
+
+    # return the schedule
+    return schedule, iteration_space
+
 def get_schedule(self):
     """
     returns a (unoptimised) schedule for the execution of the hardware for
@@ -561,37 +601,9 @@ def get_schedule(self):
         # find the hardware node
         hw_node = self.get_building_block(exec_node)
 
-        # handle different hardware types
-        match self.net.graph.nodes[exec_node]["type"]:
-            case LAYER_TYPE.Convolution:
-                schedule[exec_node], iteration_space[exec_node] = \
-                        self.get_convolution_schedule(hw_node, exec_node)
-            case LAYER_TYPE.InnerProduct:
-                schedule[exec_node], iteration_space[exec_node] = \
-                        self.get_inner_product_schedule(hw_node, exec_node)
-            case LAYER_TYPE.Pooling:
-                schedule[exec_node], iteration_space[exec_node] = \
-                        self.get_pooling_schedule(hw_node, exec_node)
-            case LAYER_TYPE.ReLU | LAYER_TYPE.Sigmoid | LAYER_TYPE.SiLU:
-                schedule[exec_node], iteration_space[exec_node] = \
-                        self.get_basic_schedule(hw_node, exec_node)
-            case LAYER_TYPE.EltWise:
-                schedule[exec_node], iteration_space[exec_node] = \
-                        self.get_basic_schedule(hw_node, exec_node)
-            case LAYER_TYPE.GlobalPooling:
-                schedule[exec_node], iteration_space[exec_node] = \
-                        self.get_basic_schedule(hw_node, exec_node)
-            case _:
-                raise NotImplementedError(self.net.graph.nodes[exec_node]["type"],
-                        "schedule not implemented")
-
-        # change rows_in, cols_in, depth_in, etc... to rows, cols, depth, ...
-        for i in range(len(schedule[exec_node])):
-            schedule[exec_node][i][0]["rows"] = schedule[exec_node][i][0]["rows_in"]
-            schedule[exec_node][i][0]["cols"] = schedule[exec_node][i][0]["cols_in"]
-            schedule[exec_node][i][0]["channels"] = schedule[exec_node][i][0]["channels_in"]
-            if "depth_in" in schedule[exec_node][i][0]:
-                schedule[exec_node][i][0]["depth"] = schedule[exec_node][i][0]["depth_in"]
+        # get the schedule of the node
+        schedule[exec_node], iteration_space[exec_node] = \
+                self.get_exec_node_schedule(hw_node, exec_node)
 
     # validate the schedule
     self.validate_schedule(schedule, iteration_space)
@@ -609,52 +621,55 @@ def validate_schedule(self, schedule, iteration_space):
 
     # iterate over exec nodes in schedule
     for exec_node in self.net.graph.nodes:
-
-        # get the hw_node and check the schedule parameters fit within the hw node
-        hw_node = self.get_building_block(exec_node)
-        hw_node_type = self.building_blocks[hw_node]["type"]
-        hw_node = self.building_blocks[hw_node]["hw"]
-
-        for conf in schedule[exec_node]:
-            for param, val in conf[0].items():
-                # assertion message
-                assertion_message = f"[{exec_node}] {param} too large! ({val})"
-                # get the hw_node param
-                match param:
-                    case "batch_size":
-                        pass
-                    case "rows_in":
-                        assert val <= hw_node.rows_in(), assertion_message
-                    case "cols_in":
-                        assert val <= hw_node.cols_in(), assertion_message
-                    case "depth_in":
-                        assert val <= hw_node.depth_in(), assertion_message
-                    case "channels_in":
-                        assert val <= hw_node.channels_in(), assertion_message
-                    case "coarse_in":
-                        if hw_node_type == LAYER_TYPE.EltWise:
-                            assert val <= hw_node.streams_in(), assertion_message
-                        else:
-                            assert val <= hw_node.coarse_in, assertion_message
-                    case "coarse_out":
-                        if hw_node_type == LAYER_TYPE.EltWise:
-                            assert val <= hw_node.streams_out(), assertion_message
-                        else:
-                            assert val <= hw_node.coarse_out, assertion_message
-                    case "mem_bw_in" | "mem_bw_out":
-                        assert val <= getattr(hw_node, param) + 1e-4, assertion_message
-                    case "rows" | "cols" | "depth" | "channels":
-                        pass
-                    case "rows_out" | "cols_out" | "depth_out" | "channels_out":
-                        pass
-                    case "data_t" | "weight_t" | "acc_t" | "input_t" | "output_t":
-                        pass
-                    case "mem_bw_in_array" | "mem_bw_out_array":
-                        pass
-                    case "has_bias":
-                        pass
-                    case "op_type":
-                        pass
-                    case _:
-                        assert val <= getattr(hw_node, param), assertion_message
+        self.validate_exec_node_schedule(schedule, exec_node)
+
+def validate_exec_node_schedule(self, schedule, exec_node):
+
+    # get the hw_node and check the schedule parameters fit within the hw node
+    hw_node = self.get_building_block(exec_node)
+    hw_node_type = self.building_blocks[hw_node]["type"]
+    hw_node = self.building_blocks[hw_node]["hw"]
+
+    for conf in schedule[exec_node]:
+        for param, val in conf[0].items():
+            # assertion message
+            assertion_message = f"[{exec_node}] {param} too large! ({val})"
+            # get the hw_node param
+            match param:
+                case "batch_size":
+                    pass
+                case "rows_in":
+                    assert val <= hw_node.rows_in(), assertion_message
+                case "cols_in":
+                    assert val <= hw_node.cols_in(), assertion_message
+                case "depth_in":
+                    assert val <= hw_node.depth_in(), assertion_message
+                case "channels_in":
+                    assert val <= hw_node.channels_in(), assertion_message
+                case "coarse_in":
+                    if hw_node_type == LAYER_TYPE.EltWise:
+                        assert val <= hw_node.streams_in(), assertion_message
+                    else:
+                        assert val <= hw_node.coarse_in, assertion_message
+                case "coarse_out":
+                    if hw_node_type == LAYER_TYPE.EltWise:
+                        assert val <= hw_node.streams_out(), assertion_message
+                    else:
+                        assert val <= hw_node.coarse_out, assertion_message
+                case "mem_bw_in" | "mem_bw_out":
+                    assert val <= getattr(hw_node, param) + 1e-4, assertion_message
+                case "rows" | "cols" | "depth" | "channels":
+                    pass
+                case "rows_out" | "cols_out" | "depth_out" | "channels_out":
+                    pass
+                case "data_t" | "weight_t" | "acc_t" | "input_t" | "output_t":
+                    pass
+                case "mem_bw_in_array" | "mem_bw_out_array":
+                    pass
+                case "has_bias":
+                    pass
+                case "op_type":
+                    pass
+                case _:
+                    assert val <= getattr(hw_node, param), assertion_message
 
@@ -10,6 +10,8 @@ import pandas as pd
 import time
 
 from fpgaconvnet.optimiser.latency.solvers.solver import LatencySolver
+from fpgaconvnet.optimiser.solvers.state import BlockJournal
+from fpgaconvnet.optimiser.profiler import profiled
 
 LATENCY     =   0
 THROUGHPUT  =   1
@@ -25,14 +27,42 @@ class LatencySimulatedAnnealing(LatencySolver):
     transform_iterations: int = 15
     warm_start: bool = True
     warm_start_time_limit: int = 90
+    adaptive_cooling: bool = False
+    cool_min: float = 0.9
+    cooling_lambda: float = 0.7
+    cooling_window: int = 20
+    target_acceptance: float = 0.4
+    stagnation_window: int = 0
     """
     Randomly chooses a transform and hardware component to change.
-    The change is accepted based on a probability-based decision function
+    The change is accepted based on a probability-based decision function.
+    The cooling schedule is either fixed, or adapts to the spread of the
+    cost and the acceptance rate, and the run can stop early once the cost
+    stagnates.
     """
 
+    # cooling schedule
+    from fpgaconvnet.optimiser.solvers.cooling import reset_schedule
+    from fpgaconvnet.optimiser.solvers.cooling import update_temperature
+    from fpgaconvnet.optimiser.solvers.cooling import is_stagnated
+
+    def rollback(self):
+        """
+        undoes the transforms of this step, updating the execution node
+        index if building blocks were added or removed, and marking the
+        restored blocks as dirty
+        """
+        structural = self.undo_log.blocks is not None
+        self.mark_blocks_dirty(self.undo_log.entries.keys())
+        self.building_blocks = self.undo_log.rollback(self.building_blocks)
+        if structural:
+            self.update_exec_node_index()
+            self.mark_blocks_dirty()
+
     def warm_start_solution(self):
         start_time = time.time()
-        while not self.check_resources() and (time.time() - start_time) < self.warm_start_time_limit:
+        while not self.check_resources() and (time.time() - start_time) < self.warm_start_time_limit \
+                and not self.out_of_time():
             # Choose a random transform
             transform = random.choice(list(self.transforms.keys()))
 
@@ -45,16 +75,18 @@ class LatencySimulatedAnnealing(LatencySolver):
             # Apply the transform
             self.apply_transform(transform, hw_node, exec_node, warm_start=True)
 
-        if time.time() - start_time >= self.warm_start_time_limit:
+        if not self.check_resources():
             raise Exception("Warm start failed to find a solution within the time limit")
 
         # perform a few iterations of the solver to improve the initial solution
         for _ in range(START_LOOP):
+            if self.out_of_time():
+                break
             # get the current cost
             cost = self.get_cost()
 
-            # Save previous building blocks
-            building_blocks = copy.deepcopy(self.building_blocks)
+            # record the changed building blocks, so they can be undone
+            self.undo_log = BlockJournal()
 
             # several transform iterations per cool down
             for _ in range(self.transform_iterations):
@@ -77,7 +109,7 @@ class LatencySimulatedAnnealing(LatencySolver):
                 self.check_building_blocks()
             except AssertionError:
                 # revert to previous state
-                self.building_blocks = building_blocks
+                self.rollback()
                 continue
 
             # Simulated annealing descision
@@ -87,8 +119,12 @@ class LatencySimulatedAnnealing(LatencySolver):
                 pass
             else:
                 # revert to previous state
-                self.building_blocks = building_blocks
+                self.rollback()
+
+        # stop recording transforms
+        self.undo_log = None
 
+    @profiled("run_solver")
     def run_solver(self, log=True):
 
         if self.warm_start:
@@ -102,15 +138,21 @@ class LatencySimulatedAnnealing(LatencySolver):
         except AssertionError as error:
             raise AssertionError("Initial design exceeded resource usage")
 
+        # keep the starting point as the best design so far
+        self.record_best()
+
+        # start the cooling schedule
+        self.reset_schedule()
+
         # Cooling Loop
-        while self.T_min < self.T:
+        while self.T_min < self.T and not self.out_of_time():
 
             # get the current cost
             cost = self.get_cost()
             resources = self.get_resources()
 
-            # Save previous building blocks
-            building_blocks = copy.deepcopy(self.building_blocks)
+            # record the changed building blocks, so they can be undone
+            self.undo_log = BlockJournal()
 
             # several transform iterations per cool down
             # transform_iterations = random.randint(1, self.transform_iterations)
@@ -136,12 +178,14 @@ class LatencySimulatedAnnealing(LatencySolver):
                 self.check_building_blocks()
             except AssertionError:
                 # revert to previous state
-                self.building_blocks = building_blocks
+                self.rollback()
+                self.profiler.record_move(False)
                 continue
 
             # Simulated annealing descision
             curr_cost = self.get_cost()
             status_cost = curr_cost
+            accepted = True
             if curr_cost < cost:
                 # accept new state
                 pass
@@ -156,12 +200,17 @@ class LatencySimulatedAnnealing(LatencySolver):
                     pass
                 else:
                     # revert to previous state
-                    self.building_blocks = building_blocks
+                    self.rollback()
                     status_cost = cost
+                    accepted = False
+            self.profiler.record_move(accepted)
 
             # print solver status
             self.solver_status(self.T, cost=status_cost)
 
+            # keep the best design
+            self.record_best(status_cost)
+
             # wandb logging and checkpoint
             if log:
                 self.wandb_log(temperature=self.T,
@@ -170,7 +219,21 @@ class LatencySimulatedAnnealing(LatencySolver):
                     **self.get_resources_util())
 
             # reduce temperature
-            self.T *= self.cool
+            self.update_temperature(status_cost, accepted)
+
+            # save a checkpoint of the current design
+            self.save_checkpoint()
+
+            # stop once the cost has converged
+            if self.is_stagnated(status_cost):
+                print(f"Stopping, cost has not improved for {self.stagnation_window} steps")
+                break
+
+        # stop recording transforms
+        self.undo_log = None
+
+        # finish with the best design found
+        self.restore_best()
 
         if log:
 
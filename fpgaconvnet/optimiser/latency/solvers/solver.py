@@ -12,7 +12,10 @@ import numpy as np
 from fpgaconvnet.tools.layer_enum import  LAYER_TYPE
 from fpgaconvnet.models.network import Network
 
-from fpgaconvnet.optimiser.latency.solvers.utils import get_hw_from_dict, get_runtime_latency, apply_mem_bw_limitations
+from fpgaconvnet.optimiser.latency.solvers.utils import get_hw_from_dict, get_runtime_latencies, apply_mem_bw_limitations
+from fpgaconvnet.optimiser.solvers.state import get_attribute_state, set_layer_state, \
+        get_rng_state, set_rng_state
+from fpgaconvnet.optimiser.profiler import profiled
 import fpgaconvnet.optimiser.solvers.solver
 
 @dataclass
@@ -23,6 +26,7 @@ class LatencySolver(fpgaconvnet.optimiser.solvers.solver.Solver):
     weight_storage: str = "double_buffer"
     channel_tiling: bool = True # whether or not to allow for channel reloading
     filter_tiling: bool = True # whether or not to allow for channel reloading
+    debug: bool = False # whether or not to check the execution node index
 
     def __post_init__(self):
 
@@ -35,6 +39,31 @@ class LatencySolver(fpgaconvnet.optimiser.solvers.solver.Solver):
             self.building_blocks[node] = copy.deepcopy(self.net.graph.nodes[node])
             self.building_blocks[node]["exec_nodes"] = [ node ]
 
+        # building block of each execution node
+        self.update_exec_node_index()
+
+        # latency of each execution node, keyed by its building block's parameters,
+        # and their total
+        self.latency_cache = {}
+        self.latency_total = 0
+
+        # private copy of the layer of each building block, that the runtime
+        # parameters are evaluated on, keyed by the block's parameters
+        self.runtime_layers = {}
+
+        # building blocks as they were when last evaluated, the blocks changed
+        # since, and whether blocks may have been added, removed or replaced since
+        self.evaluated_blocks = { "latency": {}, "resources": {}, "memory_bandwidth": {} }
+        self.dirty_blocks = { "latency": set(), "resources": set(), "memory_bandwidth": set() }
+        self.restructured = { "latency": True, "resources": True, "memory_bandwidth": True }
+
+        # resources and memory bandwidth of each building block, keyed by its
+        # parameters, and their totals
+        self.resource_cache = {}
+        self.resource_totals = { "LUT": 0, "FF": 0, "DSP": 0, "BRAM": 0 }
+        self.memory_bandwidth_cache = {}
+        self.memory_bandwidth_total = 0
+
         # combine simple layer types
         self.simple_layer_types = [ LAYER_TYPE.ReLU, LAYER_TYPE.EltWise, LAYER_TYPE.Pooling,
                 LAYER_TYPE.Sigmoid, LAYER_TYPE.SiLU, LAYER_TYPE.GlobalPooling ]
@@ -104,8 +133,10 @@ class LatencySolver(fpgaconvnet.optimiser.solvers.solver.Solver):
     from fpgaconvnet.optimiser.latency.solvers.scheduler import get_inner_product_schedule
     from fpgaconvnet.optimiser.latency.solvers.scheduler import get_pooling_schedule
     from fpgaconvnet.optimiser.latency.solvers.scheduler import get_basic_schedule
+    from fpgaconvnet.optimiser.latency.solvers.scheduler import get_exec_node_schedule
     from fpgaconvnet.optimiser.latency.solvers.scheduler import get_schedule
     from fpgaconvnet.optimiser.latency.solvers.scheduler import validate_schedule
+    from fpgaconvnet.optimiser.latency.solvers.scheduler import validate_exec_node_schedule
 
     def apply_weight_storage(self):
         # iterate over building blocks
@@ -134,6 +165,55 @@ class LatencySolver(fpgaconvnet.optimiser.solvers.solver.Solver):
         # return layers
         return hw_nodes_of_type
 
+    def get_design(self):
+        """
+        returns a snapshot of the building blocks, storing only the type,
+        execution nodes and parameters of each block
+        """
+        return { hw_node: {
+            "type": block["type"].name,
+            "exec_nodes": list(block["exec_nodes"]),
+            "hw": get_attribute_state(block["hw"]),
+        } for hw_node, block in self.building_blocks.items() }
+
+    def set_design(self, design):
+        """
+        restores the building blocks from a snapshot taken with `get_design`
+        """
+        self.building_blocks = {}
+        for hw_node, block in design.items():
+            # start from the layer of an execution node, with the stored parameters
+            hw = copy.deepcopy(self.net.graph.nodes[block["exec_nodes"][0]]["hw"])
+            set_layer_state(hw, block["hw"])
+            self.building_blocks[hw_node] = {
+                "type": LAYER_TYPE[block["type"]],
+                "hw": hw,
+                "exec_nodes": list(block["exec_nodes"]),
+            }
+        self.update_exec_node_index()
+        self.mark_blocks_dirty()
+
+    def get_checkpoint(self):
+        """
+        returns a checkpoint of the building blocks, along with the
+        parameters of the solver and the state of the random number generators.
+        """
+        return {
+            "solver": self.get_solver_state(),
+            "rng": get_rng_state(),
+            "building_blocks": self.get_design(),
+        }
+
+    def load_checkpoint(self, checkpoint):
+        """
+        restores the building blocks from a checkpoint created with
+        `get_checkpoint`
+        """
+        self.set_design(checkpoint["building_blocks"])
+        # restore the solver parameters and random number generators
+        self.set_solver_state(checkpoint["solver"])
+        set_rng_state(checkpoint["rng"])
+
     def wandb_log(self, **kwargs):
         # get common log values
         wandb_log = {}
@@ -152,6 +232,7 @@ class LatencySolver(fpgaconvnet.optimiser.solvers.solver.Solver):
         # cost
         if cost is None:
             cost = self.get_cost()
+        self.profiler.record_cost(cost)
         # Resources
         resources = self.get_resources()
         BRAM = resources['BRAM']
@@ -163,20 +244,71 @@ class LatencySolver(fpgaconvnet.optimiser.solvers.solver.Solver):
         print("TEMP:\t {temperature:.5f}, COST:\t {cost:.3f} ({objective}), RESOURCE:\t {DSP}\t{BRAM}\t{FF}\t{LUT}\t| {MEM_BW:.2f} ({MEM_BW_UTIL:.2f})\t(DSP|BRAM|FF|LUT) | MEM_BW (%)".format(
             temperature=temp, cost=cost,objective=objective,DSP=int(DSP),BRAM=int(BRAM),FF=int(FF),LUT=int(LUT),MEM_BW=MEM_BW,MEM_BW_UTIL=MEM_BW_UTIL))
 
+    def update_resource_totals(self):
+        """
+        updates the running totals of the resources of the building blocks.
+        The resources of each block are cached with its parameters, and only
+        the blocks added, removed or changed since the last update are
+        evaluated.
+        """
+        for hw_node in self.pop_dirty_blocks("resources"):
+            # get the parameters of the block, if it still exists
+            fingerprint = self.get_building_block_fingerprint(hw_node) \
+                    if hw_node in self.building_blocks else None
+            # take the previous resources of the block off the totals
+            if hw_node in self.resource_cache:
+                if self.resource_cache[hw_node][0] == fingerprint:
+                    continue
+                _, rsc = self.resource_cache.pop(hw_node)
+                for key in self.resource_totals:
+                    self.resource_totals[key] -= rsc[key]
+            if fingerprint is None:
+                continue
+            # evaluate the resources of the block
+            rsc = self.building_blocks[hw_node]["hw"].resource()
+            rsc = { key: math.ceil(rsc[key]) for key in self.resource_totals }
+            self.resource_cache[hw_node] = (fingerprint, rsc)
+            for key in self.resource_totals:
+                self.resource_totals[key] += rsc[key]
+
+    def update_memory_bandwidth(self):
+        """
+        updates the running total of the memory bandwidth of the building
+        blocks, in the same way as `update_resource_totals`
+        """
+        freq = self.net.platform.board_freq
+        for hw_node in self.pop_dirty_blocks("memory_bandwidth"):
+            # get the parameters of the block, if it still exists
+            fingerprint = self.get_building_block_fingerprint(hw_node) \
+                    if hw_node in self.building_blocks else None
+            # take the previous memory bandwidth of the block off the total
+            if hw_node in self.memory_bandwidth_cache:
+                if self.memory_bandwidth_cache[hw_node][0] == fingerprint:
+                    continue
+                _, mem_bw = self.memory_bandwidth_cache.pop(hw_node)
+                self.memory_bandwidth_total -= mem_bw
+            if fingerprint is None:
+                continue
+            # evaluate the memory bandwidth of the block
+            mem_bw = self.building_blocks[hw_node]["hw"].memory_bandwidth()
+            mem_bw = mem_bw['in']*freq*16*1e-3 + mem_bw['out']*freq*16*1e-3
+            self.memory_bandwidth_cache[hw_node] = (fingerprint, mem_bw)
+            self.memory_bandwidth_total += mem_bw
+
+    def get_memory_bandwidth(self):
+        """
+        returns the mean memory bandwidth of the building blocks, from their
+        running total
+        """
+        self.update_memory_bandwidth()
+        return self.memory_bandwidth_total / len(self.building_blocks)
+
     def get_resources(self):
         """
         returns the sum of the resources of all nodes in the building_blocks
         """
-        node_rscs = [ node["hw"].resource() for _, node in self.building_blocks.items() ]
-        return {
-            "LUT" : sum([ math.ceil(rsc["LUT"]) for rsc in node_rscs ]),
-            "FF"  : sum([ math.ceil(rsc["FF"]) for rsc in node_rscs ]),
-            "DSP" : sum([ math.ceil(rsc["DSP"]) for rsc in node_rscs ]),
-            "BRAM": sum([ math.ceil(rsc["BRAM"]) for rsc in node_rscs ]),
-            "MEM_BW": np.mean([ node["hw"].memory_bandwidth()['in']*self.net.platform.board_freq*16*1e-3 + \
-                    node["hw"].memory_bandwidth()['out']*self.net.platform.board_freq*16*1e-3 \
-                    for _, node in self.building_blocks.items() ])
-        }
+        self.update_resource_totals()
+        return { **self.resource_totals, "MEM_BW": self.get_memory_bandwidth() }
 
     def get_resources_util(self):
         # get resources
@@ -225,16 +357,51 @@ class LatencySolver(fpgaconvnet.optimiser.solvers.solver.Solver):
                         # assert self.net.graph.nodes[exec_node]["hw"].channels_out() <= \
                         #         self.building_blocks[hw_node]["hw"].channels_out()
 
+    def update_exec_node_index(self):
+        """
+        rebuilds the index of the building block of each execution node,
+        used when `building_blocks` is replaced as a whole
+        """
+        self.exec_node_index = { exec_node: hw_node \
+                for hw_node in self.building_blocks \
+                for exec_node in self.building_blocks[hw_node]["exec_nodes"] }
+
+    def check_exec_node_index(self):
+        """
+        check that the execution node index matches `building_blocks`
+        """
+        exec_node_index = dict(self.exec_node_index)
+        self.update_exec_node_index()
+        assert exec_node_index == self.exec_node_index, \
+                "execution node index is inconsistent with the building blocks"
+
     def get_building_block(self, exec_node):
         """
         find the corresponding hardware node for the node to be executed
         """
-        for hw_node in self.building_blocks:
-            if exec_node in self.building_blocks[hw_node]["exec_nodes"]:
-                return hw_node
-        raise StopIteration(f"could not find hardware for execution node {exec_node}")
+        if self.debug:
+            self.check_exec_node_index()
+        try:
+            return self.exec_node_index[exec_node]
+        except KeyError:
+            raise StopIteration(f"could not find hardware for execution node {exec_node}")
+
+    def get_runtime_layer(self, hw_node, fingerprint=None):
+        """
+        returns a private copy of the layer of a building block, that the
+        runtime parameters are written to, so that the block itself is never
+        changed. Every schedule entry of a layer type writes the same
+        parameters, so the copy is only made again once the block changes.
+        """
+        if fingerprint is None:
+            fingerprint = self.get_building_block_fingerprint(hw_node)
+        if hw_node not in self.runtime_layers or \
+                self.runtime_layers[hw_node][0] != fingerprint:
+            self.runtime_layers[hw_node] = (fingerprint,
+                    copy.deepcopy(self.building_blocks[hw_node]["hw"]))
+        return self.runtime_layers[hw_node][1]
 
-    def evaluate_latency_exec_node(self, schedule, exec_node):
+    def evaluate_latency_exec_node(self, schedule, exec_node, fingerprint=None):
 
         # find the hardware node
         hw_node = self.get_building_block(exec_node)
@@ -266,11 +433,11 @@ class LatencySolver(fpgaconvnet.optimiser.solvers.solver.Solver):
             # param_cntr = Counter(param_tuple)
 
             # get the latency for each repeated parameter execution
-            for param, repetition in schedule[exec_node]:
-                exec_latency = get_runtime_latency(
-                    self.building_blocks[hw_node]["type"],
-                    self.building_blocks[hw_node]["hw"],
-                    param, self.dimensionality)
+            exec_latencies = get_runtime_latencies(
+                self.building_blocks[hw_node]["type"],
+                self.get_runtime_layer(hw_node, fingerprint),
+                [ param for param, _ in schedule[exec_node] ], self.dimensionality)
+            for (_, repetition), exec_latency in zip(schedule[exec_node], exec_latencies.tolist()):
                 latency += repetition*exec_latency
 
             # # add extra penalty for reconfiguration # TODO: need to tune with real data
@@ -283,57 +450,142 @@ class LatencySolver(fpgaconvnet.optimiser.solvers.solver.Solver):
         # return the latency (in clock cycles)
         return latency
 
+    def mark_blocks_dirty(self, hw_nodes=None):
+        """
+        flags the given building blocks as changed, so that they are
+        evaluated again. Without any blocks given, blocks may have been
+        added, removed or replaced, so every block is compared with the one
+        last evaluated.
+        """
+        for key in self.dirty_blocks:
+            if hw_nodes is None:
+                self.restructured[key] = True
+            else:
+                self.dirty_blocks[key].update(hw_nodes)
+
+    def pop_dirty_blocks(self, key):
+        """
+        returns the building blocks added, removed or changed since they
+        were last evaluated for `key`, and marks them as evaluated
+        """
+        evaluated = self.evaluated_blocks[key]
+        dirty = self.dirty_blocks[key]
+        if self.restructured[key]:
+            dirty |= { hw_node for hw_node, block in self.building_blocks.items() \
+                    if evaluated.get(hw_node) is not block }
+            dirty |= evaluated.keys() - self.building_blocks.keys()
+        self.dirty_blocks[key], self.restructured[key] = set(), False
+        for hw_node in dirty:
+            if hw_node in self.building_blocks:
+                evaluated[hw_node] = self.building_blocks[hw_node]
+            else:
+                evaluated.pop(hw_node, None)
+        return dirty
+
+    def get_building_block_fingerprint(self, hw_node):
+        """
+        returns a hashable summary of the parameters of a building block,
+        which change whenever a transform changes the block
+        """
+        state = get_attribute_state(self.building_blocks[hw_node]["hw"])
+        return (self.building_blocks[hw_node]["type"], repr(sorted(state.items())))
+
     def evaluate_latency(self):
         """
         evaluate the latency for the execution of the graph. Maps the
         nodes of the `self.net.graph` to those of the `self.building_blocks`.
         The latency is the sum of the execution of all these elements.
+
+        The latency of each execution node is cached with the parameters of
+        its building block, along with their total, so only the execution
+        nodes of building blocks changed since the last evaluation are
+        rescheduled.
         """
-        # total execution latency
-        total_latency = 0
+        if self.debug:
+            self.check_exec_node_index()
 
-        # get the schedule
-        schedule, iteration_space = self.get_schedule()
-        for exec_node in iteration_space:
-            assert sum([ i for _, i in schedule[exec_node] ]) == np.prod(iteration_space[exec_node]), "iteration space must match"
+        # iterate over the building blocks changed since the last evaluation
+        for hw_node in self.pop_dirty_blocks("latency"):
+
+            # the execution nodes of a removed block belong to changed blocks
+            if hw_node not in self.building_blocks:
+                self.runtime_layers.pop(hw_node, None)
+                continue
+
+            # get the parameters of the building block
+            fingerprint = self.get_building_block_fingerprint(hw_node)
 
-        # iterate over nodes in the execution graph
-        for exec_node in self.net.graph:
+            # iterate over the execution nodes of the building block
+            for exec_node in self.building_blocks[hw_node]["exec_nodes"]:
 
-            # evaluate the latency of the node for the schedule
-            total_latency += self.evaluate_latency_exec_node(schedule, exec_node)
+                # use the cached latency if the parameters are unchanged
+                if exec_node in self.latency_cache and \
+                        self.latency_cache[exec_node][0] == fingerprint:
+                    continue
 
-        # latency in ms
-        total_latency = total_latency / (self.net.platform.board_freq*1e3)
+                # get the schedule of the node
+                schedule, iteration_space = self.get_exec_node_schedule(hw_node, exec_node)
+                schedule = { exec_node: schedule }
+                assert sum([ i for _, i in schedule[exec_node] ]) == np.prod(iteration_space), "iteration space must match"
+                self.validate_exec_node_schedule(schedule, exec_node)
 
-        # return the overall latency
-        return total_latency
+                # evaluate the latency of the node for the schedule
+                latency = self.evaluate_latency_exec_node(schedule, exec_node, fingerprint)
 
+                # update the total latency
+                if exec_node in self.latency_cache:
+                    self.latency_total -= self.latency_cache[exec_node][1]
+                self.latency_cache[exec_node] = (fingerprint, latency)
+                self.latency_total += latency
+
+        # return the overall latency (in ms)
+        return self.latency_total / (self.net.platform.board_freq*1e3)
+
+    @profiled("get_cost")
     def get_cost(self):
         return self.evaluate_latency()
 
+    @profiled("check_resources")
     def check_resources(self):
-        # get the resources
-        resources = self.get_resources()
-        # check against board constraints
-        if resources['FF']   > self.net.rsc_allocation * \
-            self.net.platform.get_ff():
-            return False
-        if resources['LUT']  > self.net.rsc_allocation * \
-            self.net.platform.get_lut():
-            return False
-        if resources['DSP']  > self.net.rsc_allocation * \
-            self.net.platform.get_dsp():
-            return False
-        if resources['BRAM'] > self.net.rsc_allocation * \
-            self.net.platform.get_bram():
-            return False
-        if resources['MEM_BW'] > self.net.platform.get_mem_bw():
-            return False
-        return True
+        # update the totals of the changed building blocks
+        self.update_resource_totals()
+        # check against board constraints, stopping at the first violation
+        limits = {
+            "FF": self.net.platform.get_ff(),
+            "LUT": self.net.platform.get_lut(),
+            "DSP": self.net.platform.get_dsp(),
+            "BRAM": self.net.platform.get_bram(),
+        }
+        for key, limit in limits.items():
+            if self.resource_totals[key] > self.net.rsc_allocation * limit:
+                return False
+        # the memory bandwidth is only evaluated once the resources fit
+        return self.get_memory_bandwidth() <= self.net.platform.get_mem_bw()
 
+    def record_transform(self, transform, hw_node):
+        """
+        marks the building blocks that the given transform can change as
+        dirty, and records them in `self.undo_log` if set. Combining and
+        seperating add and remove blocks, and seperating also changes the
+        seperated block, whereas the other transforms only change their own
+        block. Writes of the weight storage and memory bandwidth to every
+        block leave their values unchanged, so are not recorded.
+        """
+        if transform in ["combine", "seperate"]:
+            self.mark_blocks_dirty()
+            if self.undo_log is not None:
+                self.undo_log.record_blocks(self.building_blocks)
+        if transform in ["seperate", "fine", "coarse", "shape"]:
+            self.mark_blocks_dirty([hw_node])
+            if self.undo_log is not None:
+                self.undo_log.record_block(self.building_blocks, hw_node)
+
+    @profiled("apply_transform", per_transform=True)
     def apply_transform(self, transform, hw_node, exec_node, warm_start=False):
 
+        # record the building blocks the transform changes
+        self.record_transform(transform, hw_node)
+
         # switch case across transforms
         match transform:
             case "fine":
@@ -1,3 +1,6 @@
+
+import numpy as np
+
 from fpgaconvnet.tools.layer_enum import LAYER_TYPE
 
 from fpgaconvnet.models.layers import ConvolutionLayer, ConvolutionLayer3D
@@ -301,6 +304,36 @@ def get_runtime_latency(layer_type, node, param, dimensionality):
     # return latency
     return latency
 
+def get_runtime_latencies(layer_type, node, params, dimensionality):
+    """
+    returns the latency of each of the given parameters (i.e. the entries of
+    a schedule) on the given layer. The parameters that vary between entries
+    are gathered into an array, and each unique row is evaluated once by
+    writing it to the layer. The layer is left with the parameters of the
+    last row, so it must be a private copy rather than a shared building
+    block.
+    """
+    # no parameters to evaluate
+    if not params:
+        return np.zeros(0)
+
+    # find the (numerical) parameters that vary between entries
+    keys = [ key for key in params[0] if any(param[key] != params[0][key] for param in params) ]
+    rows = np.array([ [ param[key] for key in keys ] for param in params ],
+            dtype=float).reshape(len(params), len(keys))
+
+    # get the unique rows of parameters
+    _, index, inverse = np.unique(rows, axis=0, return_index=True, return_inverse=True)
+
+    # get the latency of each unique row on the layer
+    latencies = []
+    for i in index:
+        update_node_param(layer_type, node, params[i], dimensionality)
+        latencies.append(node.latency())
+
+    # return the latency of every entry
+    return np.array(latencies)[inverse.reshape(-1)]
+
 def apply_mem_bw_limitations(graph, building_blocks, total_mem_bw, channel_tiling=False):
 
     # split the memory bandwidth equally between the in and out
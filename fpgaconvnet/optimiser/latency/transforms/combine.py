@@ -198,6 +198,10 @@ def combine(self, layer_type, discriminate=[], num_nodes=2):
     for layer in nodes_to_combine:
         del self.building_blocks[layer]
 
+    # point the execution nodes to the new layer
+    for exec_node in exec_nodes:
+        self.exec_node_index[exec_node] = new_layer_name
+
     # apply memory bandwidth limitations
     apply_mem_bw_limitations(self.net.graph, self.building_blocks,
             self.net.platform.mem_bw_wpc, channel_tiling=self.channel_tiling)
@@ -26,6 +26,7 @@ def seperate(self, hw_node, num_nodes=1):
         # add hardware of exec_node to the latency nodes
         self.building_blocks[exec_node] = copy.deepcopy(self.net.graph.nodes[exec_node])
         self.building_blocks[exec_node]["exec_nodes"] = [ exec_node ]
+        self.exec_node_index[exec_node] = exec_node
 
         # delete the original node if it has no exec nodes
         if self.building_blocks[hw_node]["exec_nodes"] == []:
@@ -0,0 +1,123 @@
+"""
+Instrumentation of the solvers, accumulating the wall time and number of
+calls of each phase of a run (applying transforms, updating partitions,
+checking resources, ...), along with the rate and acceptance of moves.
+"""
+
+import json
+import time
+import functools
+from contextlib import contextmanager
+
+class Profiler:
+    """
+    Accumulates the wall time and calls of each phase of a solver. Phases
+    are inclusive of any phases called within them, and recursive calls of
+    a phase are only timed once.
+    """
+
+    def __init__(self):
+        # time and calls per phase and per transform
+        self.phases = {}
+        self.transforms = {}
+        # number of moves, and how many were accepted
+        self.moves = 0
+        self.accepted = 0
+        # cost of the design over time
+        self.start = time.perf_counter()
+        self.trace = []
+        # depth of each phase currently running
+        self.depth = {}
+
+    @contextmanager
+    def phase(self, name, transform=None):
+        """
+        times the enclosed code as the given phase, and as the given
+        transform type if set
+        """
+        self.depth[name] = self.depth.get(name, 0) + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.depth[name] -= 1
+            # only time the outermost call of a phase
+            if self.depth[name] == 0:
+                elapsed = time.perf_counter() - start
+                self.add(self.phases, name, elapsed)
+                if transform is not None:
+                    self.add(self.transforms, transform, elapsed)
+
+    def add(self, stats, name, elapsed):
+        stats.setdefault(name, { "time": 0.0, "calls": 0 })
+        stats[name]["time"] += elapsed
+        stats[name]["calls"] += 1
+
+    def merge(self, other):
+        """
+        adds the phases and moves of another profile, such as that of a
+        worker process
+        """
+        for name, stats in other.phases.items():
+            self.phases.setdefault(name, { "time": 0.0, "calls": 0 })
+            self.phases[name]["time"] += stats["time"]
+            self.phases[name]["calls"] += stats["calls"]
+        for name, stats in other.transforms.items():
+            self.transforms.setdefault(name, { "time": 0.0, "calls": 0 })
+            self.transforms[name]["time"] += stats["time"]
+            self.transforms[name]["calls"] += stats["calls"]
+        self.moves += other.moves
+        self.accepted += other.accepted
+
+    def record_move(self, accepted):
+        """
+        records the outcome of a move of the solver
+        """
+        self.moves += 1
+        self.accepted += int(accepted)
+
+    def record_cost(self, cost):
+        """
+        records the cost of the current design, along with the time since
+        the profiler was created
+        """
+        self.trace.append((time.perf_counter()-self.start, cost))
+
+    def report(self):
+        """
+        returns a summary of the profile
+        """
+        total_time = self.phases.get("run_solver", {}).get("time", 0.0)
+        return {
+            "total_time": total_time,
+            "moves": self.moves,
+            "accepted": self.accepted,
+            "moves_per_second": self.moves/total_time if total_time else 0.0,
+            "acceptance_rate": self.accepted/self.moves if self.moves else 0.0,
+            "phases": self.phases,
+            "transforms": self.transforms,
+            "trace": self.trace,
+        }
+
+    def write(self, output_path):
+        """
+        writes the profile as JSON to the given path
+        """
+        with open(output_path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+def profiled(name, per_transform=False):
+    """
+    decorator timing a solver method as the given phase of the solver's
+    profiler. If `per_transform` is set, the first argument of the method
+    is the transform type, which is timed as well.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            transform = args[0] if per_transform and args else kwargs.get("transform")
+            with self.profiler.phase(name, transform=transform if per_transform else None):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
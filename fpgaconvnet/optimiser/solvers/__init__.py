@@ -6,3 +6,4 @@ from .solver import Solver
 from .improve import Improve
 from .simulated_annealing import SimulatedAnnealing
 from .greedy_partition import GreedyPartition
+from .parallel_tempering import ParallelTempering
@@ -0,0 +1,59 @@
+"""
+Cooling schedule shared by the simulated annealing solvers. These functions
+are imported as methods of the solvers, which provide the `T`, `k`, `cool`,
+`cool_min`, `adaptive_cooling`, `cooling_lambda`, `cooling_window`,
+`target_acceptance` and `stagnation_window` attributes.
+"""
+
+import math
+import numpy as np
+
+def reset_schedule(self):
+    """
+    clears the history of the cooling schedule, at the start of a run
+    """
+    self.cooling_history = []
+    self.best_step_cost = float("inf")
+    self.stagnant_steps = 0
+
+def update_temperature(self, cost, accepted):
+    """
+    records the cost and outcome of an annealing step, and reduces the
+    temperature. With a fixed schedule the temperature is reduced by `cool`.
+    With an adaptive schedule, the reduction follows the variance of the
+    recent costs, `exp(-cooling_lambda*k*T/sigma)` (a large spread in cost
+    means the search is still exploring at this temperature, so it cools
+    slowly), scaled by the ratio of the recent acceptance rate to
+    `target_acceptance`. The factor is kept within `[cool_min, cool]`.
+    """
+    # keep a window of the recent steps
+    self.cooling_history.append((cost, accepted))
+    del self.cooling_history[:-self.cooling_window]
+
+    # fixed schedule, or not enough steps to adapt to
+    if not self.adaptive_cooling or len(self.cooling_history) < 2:
+        self.T *= self.cool
+        return
+
+    # spread of the recent costs and acceptance rate
+    sigma = np.std([ step_cost for step_cost, _ in self.cooling_history ])
+    acceptance_rate = np.mean([ step_accepted for _, step_accepted in self.cooling_history ])
+
+    # get the cooling factor
+    factor = math.exp(-self.cooling_lambda*self.k*self.T/sigma) if sigma > 0 else 0.0
+    reduction = (1.0-factor)*acceptance_rate/self.target_acceptance
+    self.T *= min(self.cool, max(self.cool_min, 1.0-reduction))
+
+def is_stagnated(self, cost):
+    """
+    records the cost after an annealing step, and returns whether the best
+    cost has not improved for `stagnation_window` steps. A window of zero
+    disables the check.
+    """
+    if cost < self.best_step_cost:
+        self.best_step_cost = cost
+        self.stagnant_steps = 0
+    else:
+        self.stagnant_steps += 1
+    return self.stagnation_window > 0 and self.stagnant_steps >= self.stagnation_window
+
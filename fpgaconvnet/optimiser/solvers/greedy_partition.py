@@ -4,14 +4,22 @@ import json
 import copy
 import random
 import math
+import pickle
+import contextlib
+import dataclasses
 from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
 
 from fpgaconvnet.optimiser.solvers import Solver
 import fpgaconvnet.tools.graphs as graphs
 from fpgaconvnet.tools.layer_enum import LAYER_TYPE
 
 import fpgaconvnet.optimiser.transforms as transforms
-from fpgaconvnet.optimiser.transforms.helper import get_all_layers
+from fpgaconvnet.optimiser.transforms.helper import get_all_layers, get_ordered_nodes
+from fpgaconvnet.optimiser.cache import layer_latency, layer_resource_usage, partition_latency, \
+        partition_resource_usage
+from fpgaconvnet.optimiser.solvers.state import get_partition_snapshot, set_partition_snapshot
+from fpgaconvnet.optimiser.profiler import Profiler, profiled
 import itertools
 
 LATENCY   =0
@@ -19,10 +27,116 @@ THROUGHPUT=1
 
 START_LOOP=1
 
+def get_max_subset_sum(options, budget):
+    """
+    returns the largest total below `budget` that can be made by choosing
+    exactly one integer value from each list of options. The totals that
+    can be reached are kept as a boolean array, so the cost is linear in the
+    budget and the number of options, rather than the size of their cross
+    product. If no total is below the budget, the budget itself is returned.
+    """
+    # largest total strictly below the budget
+    limit = math.ceil(budget) - 1
+    if limit < 0:
+        return int(budget)
+    # totals reachable with the options chosen so far
+    reachable = np.zeros(limit+1, dtype=bool)
+    reachable[0] = True
+    for values in options:
+        next_reachable = np.zeros_like(reachable)
+        for value in set(int(value) for value in values):
+            if 0 <= value <= limit:
+                next_reachable[value:] |= reachable[:limit+1-value]
+        reachable = next_reachable
+    # get the largest reachable total
+    totals = np.flatnonzero(reachable)
+    if len(totals) == 0:
+        return int(budget)
+    return int(totals[-1])
+
+def get_min_uram_selection(bram_saved, uram_used, required):
+    """
+    returns the indices of the layers to move to URAM, such that the BRAM
+    saved is at least `required` with the least URAM used. This is solved as
+    a knapsack over the BRAM saved, capped at `required`. If the requirement
+    can't be met, all the layers are moved.
+    """
+    required = int(required)
+    if required <= 0:
+        return []
+    # least URAM used for each amount of BRAM saved, and how it was reached
+    uram = np.full(required+1, np.inf)
+    uram[0] = 0
+    parents = []
+    for saved, used in zip(bram_saved, uram_used):
+        saved = int(saved)
+        parent = np.full(required+1, -1)
+        parents.append(parent)
+        if saved <= 0:
+            continue
+        next_uram = uram.copy()
+        # savings below the requirement
+        split = max(required-saved, 0)
+        candidate = uram[:split] + used
+        better = candidate < next_uram[saved:required]
+        next_uram[saved:required][better] = candidate[better]
+        parent[saved:required][better] = np.arange(split)[better]
+        # savings that meet the requirement
+        candidate = uram[split:] + used
+        best = int(np.argmin(candidate))
+        if candidate[best] < next_uram[required]:
+            next_uram[required] = candidate[best]
+            parent[required] = split + best
+        uram = next_uram
+    # move everything if the requirement can't be met
+    if np.isinf(uram[required]):
+        return list(range(len(bram_saved)))
+    # trace back the chosen layers
+    selection, state = [], required
+    for i in reversed(range(len(parents))):
+        if parents[i][state] >= 0:
+            selection.append(i)
+            state = parents[i][state]
+    return sorted(selection)
+
+def evaluate_merge(design, merge):
+    """
+    applies a horizontal merge to a pickled solver and re-optimises the
+    merged partition. Returns the merge, the cost of the new design (or
+    `None` if it is infeasible), the merged partition and the profile of
+    the evaluation. This is executed in a worker process.
+    """
+    solver = pickle.loads(design)
+    solver.apply_merge(merge)
+    status = solver.run_solver()
+    cost = solver.get_cost() if status else None
+    return merge, cost, solver.net.partitions[merge[0]], solver.profiler
+
+def optimise_partition(design, partition_index):
+    """
+    optimises a single partition of a pickled solver. Returns the index of
+    the partition, the optimised partition and the profile of the
+    optimisation. This is executed in a worker process.
+    """
+    solver = pickle.loads(design)
+    solver.optimise_partition(partition_index)
+    return partition_index, solver.net.partitions[partition_index], solver.profiler
+
 @dataclass
 class GreedyPartition(Solver):
     coarse_in_first: list = field(default_factory=list)
     merge_ongoing: bool = False
+    workers: int = 1
+    parallel_partitions: bool = False
+    """
+    Greedily increases the folding factors of each partition until its
+    resources are used up. Candidate merges of memory bound partitions are
+    evaluated across `workers` processes, as are the partitions themselves
+    if `parallel_partitions` is set. The latency and throughput constraints
+    depend on every partition, so each parallel partition is only checked
+    against its own resources, and the constraints are checked once on the
+    merged network instead.
+    """
 
     def reset_partition(self, partition_index):
         partition = self.net.partitions[partition_index]
@@ -37,89 +151,131 @@ class GreedyPartition(Solver):
                 partition.graph.nodes[node]["hw"].coarse_group = 1
                 partition.graph.nodes[node]["hw"].fine = 1
 
+    def apply_merge(self, merge):
+        """
+        resets the two partitions of a horizontal merge and merges them, so
+        that only the merged partition is optimised by `run_solver`
+        """
+        self.reset_partition(merge[0])
+        self.reset_partition(merge[1])
+        transforms.apply_max_weights_reloading(self.net.partitions[merge[0]])
+        transforms.merge_horizontal(self.net, *merge)
+        self.net.update_partitions()
+
+    def get_memory_bound_merges(self, reject_list):
+        """
+        returns the horizontal merges of memory bound partitions (or of
+        partitions faster than reconfiguration) that have not been rejected
+        """
+        merges = []
+        for partition_index, partition in enumerate(self.net.partitions):
+            for i in range(len(self.net.partitions)):
+                self.net.partitions[i].remove_squeeze()
+            horizontal_merges = transforms.get_all_horizontal_merges(self.net, partition_index)
+            self.net.update_partitions()
+
+            if horizontal_merges[1]:
+                if horizontal_merges[1] not in reject_list:
+                    if partition.is_input_memory_bound() and self.net.partitions[horizontal_merges[1][0]].wr_factor == 1 \
+                            or partition_latency(partition, self.net.platform.board_freq) < self.net.platform.reconf_time:
+                        merges.append(tuple(horizontal_merges[1]))
+
+            if horizontal_merges[0]:
+                if horizontal_merges[0] not in reject_list:
+                    if partition.is_output_memory_bound() and self.net.partitions[horizontal_merges[0][0]].wr_factor == 1 \
+                            or partition_latency(partition, self.net.platform.board_freq) < self.net.platform.reconf_time:
+                        merges.append(tuple(horizontal_merges[0]))
+
+        # remove duplicate merges, keeping their order
+        return list(dict.fromkeys(merges))
+
     def merge_memory_bound_partitions(self):
+        """
+        merges memory bound partitions with their neighbours. Each round, all
+        the eligible merges are evaluated in `workers` processes, each
+        re-optimising only the merged partition, and the best merges that
+        don't share a partition are committed together.
+        """
         print("resolving memory bound partitions")
         reject_list = []
         self.merge_ongoing = True
 
-        while True:
+        # worker pool for evaluating merges
+        with ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else \
+                contextlib.nullcontext() as executor:
+            while not self.out_of_time():
 
-            # cache the network
-            net= copy.deepcopy(self.net)
-
-            self.net.update_partitions()
-            cost = self.get_cost()
+                self.net.update_partitions()
+                cost = self.get_cost()
 
-            for i in range(len(self.net.partitions)):
-                self.net.partitions[i].need_optimise = False
+                for i in range(len(self.net.partitions)):
+                    self.net.partitions[i].need_optimise = False
 
-            input_memory_bound = []
-            output_memory_bound = []
+                merges = self.get_memory_bound_merges(reject_list)
+                if len(merges) == 0:
+                    break
 
-            for partition_index, partition in enumerate(self.net.partitions):
+                # remove all auxiliary layers
                 for i in range(len(self.net.partitions)):
                     self.net.partitions[i].remove_squeeze()
-                horizontal_merges = transforms.get_all_horizontal_merges(self.net, partition_index)
-                self.net.update_partitions()
-
-                if horizontal_merges[1]:
-                    if horizontal_merges[1] not in reject_list:
-                        if partition.is_input_memory_bound() and self.net.partitions[horizontal_merges[1][0]].wr_factor == 1 \
-                                or partition.get_latency(self.net.platform.board_freq) < self.net.platform.reconf_time:
-                            input_memory_bound.append(partition_index)
-
-                if horizontal_merges[0]:
-                    if horizontal_merges[0] not in reject_list:
-                        if partition.is_output_memory_bound() and self.net.partitions[horizontal_merges[0][0]].wr_factor == 1 \
-                                or partition.get_latency(self.net.platform.board_freq) < self.net.platform.reconf_time:
-                            output_memory_bound.append(partition_index)
-
-            memory_bound = input_memory_bound + output_memory_bound
-            if len(memory_bound) == 0:
-                self.net = net
-                break
-
-            # remove all auxiliary layers
-            for i in range(len(self.net.partitions)):
-                self.net.partitions[i].remove_squeeze()
-
-            ## Choose slowest partition
-            partition_latencys = [ self.net.partitions[partition_index].get_latency(
-                self.net.platform.board_freq) for partition_index in memory_bound ]
-            partition_index = memory_bound[partition_latencys.index(max(partition_latencys))]
-
-            horizontal_merges = transforms.get_all_horizontal_merges(self.net, partition_index)
 
-            if horizontal_merges[0] and partition_index in output_memory_bound:
-                self.reset_partition(horizontal_merges[0][0])
-                self.reset_partition(horizontal_merges[0][1])
-                transforms.apply_max_weights_reloading(self.net.partitions[horizontal_merges[0][0]])
-                transforms.merge_horizontal(self.net, *horizontal_merges[0])
-                current_merge = horizontal_merges[0]
-
-            elif horizontal_merges[1] and partition_index in input_memory_bound:
-                self.reset_partition(horizontal_merges[1][0])
-                self.reset_partition(horizontal_merges[1][1])
-                transforms.apply_max_weights_reloading(self.net.partitions[horizontal_merges[1][0]])
-                transforms.merge_horizontal(self.net, *horizontal_merges[1])
-                current_merge = horizontal_merges[1]
-                
-            print(current_merge)
-            self.net.update_partitions()
-            status = self.run_solver()
+                # send the current design to the workers once
+                with self.profiler.phase("pickle"):
+                    design = pickle.dumps(dataclasses.replace(self, checkpoint_path=None,
+                        best_design=None, profiler=Profiler(), workers=1))
+
+                # evaluate all the merges
+                results = (executor.map if executor is not None else map)(
+                        evaluate_merge, [design]*len(merges), merges)
+                improving = []
+                for merge, merge_cost, partition, profiler in results:
+                    self.profiler.merge(profiler)
+                    print(merge)
+                    if merge_cost is None or merge_cost >= cost:
+                        reject_list.append(merge)
+                        print("reject")
+                    else:
+                        improving.append((merge_cost, merge, partition))
+
+                # choose the best merges that don't share a partition
+                chosen = []
+                for merge_cost, merge, partition in sorted(improving, key=lambda result: result[0]):
+                    if all(set(merge).isdisjoint(other) for _, other, _ in chosen):
+                        chosen.append((merge_cost, merge, partition))
+
+                # commit the chosen merges, last first to keep the indices valid
+                partitions = list(self.net.partitions)
+                for _, merge, partition in sorted(chosen, key=lambda result: result[1], reverse=True):
+                    self.net.partitions[merge[0]:merge[1]+1] = [ partition ]
+                self.net.update_partitions()
 
-            if not status or self.get_cost() >= cost:
-                self.net= net
-                reject_list.append(current_merge)
-                print("reject")
-            else:
-                for i, merge in enumerate(reject_list):
-                    if merge[0] >= current_merge[1]:
-                        reject_list[i] = (merge[0]-1,merge[1]-1)
-                print("accept")
+                # fall back to the best merge on its own if the combination is worse
+                if len(chosen) > 1:
+                    try:
+                        self.check_resources()
+                        self.check_constraints()
+                        assert self.get_cost() <= chosen[0][0]
+                    except AssertionError:
+                        self.net.partitions = partitions
+                        merge_cost, merge, partition = chosen[0]
+                        self.net.partitions[merge[0]:merge[1]+1] = [ partition ]
+                        self.net.update_partitions()
+                        chosen = chosen[:1]
+
+                # shift the rejected merges past the committed ones
+                for _, current_merge, _ in sorted(chosen, key=lambda result: result[1], reverse=True):
+                    for i, merge in enumerate(reject_list):
+                        if merge[0] >= current_merge[1]:
+                            reject_list[i] = (merge[0]-1,merge[1]-1)
+                    print(current_merge, "accept")
+
+                # stop once no merge improves the design
+                if len(chosen) == 0:
+                    break
 
     def balance_coarse(self, partition_index):
-        net = copy.deepcopy(self.net)
+        with self.profiler.phase("snapshot"):
+            snapshot = get_partition_snapshot(self.net.partitions[partition_index])
         try:
             self.check_resources()
             self.check_constraints()
@@ -137,42 +293,46 @@ class GreedyPartition(Solver):
                 all_coarse_combination = list(filter(lambda x: x[0] * x[1] == current_coarse_in*current_coarse_out, all_coarse_combination))
                 all_coarse_combination.remove((current_coarse_in, current_coarse_out))
 
-                prev_latency = partition.graph.nodes[node]['hw'].latency()
-                prev_rsc = partition.get_resource_usage()
+                prev_latency = layer_latency(partition.graph.nodes[node]['hw'])
+                prev_rsc = partition_resource_usage(partition)
 
                 for comb in all_coarse_combination:
                     partition = self.net.partitions[partition_index]
                     partition.graph.nodes[node]['hw'].coarse_in = comb[0]
                     partition.graph.nodes[node]['hw'].coarse_out = comb[1]
                     partition.update()
-                    current_latency = partition.graph.nodes[node]['hw'].latency()
-                    current_rsc = partition.get_resource_usage()
+                    current_latency = layer_latency(partition.graph.nodes[node]['hw'])
+                    current_rsc = partition_resource_usage(partition)
 
                     if current_rsc["LUT"] >= prev_rsc["LUT"] or current_latency > prev_latency:
-                        self.net = net
+                        with self.profiler.phase("snapshot"):
+                            set_partition_snapshot(partition, snapshot)
                     else:
                         break
 
     def adjust_squeeze(self, partition_index):
-        net = copy.deepcopy(self.net)
+        with self.profiler.phase("snapshot"):
+            snapshot = get_partition_snapshot(self.net.partitions[partition_index])
         try:
             self.check_resources()
             self.check_constraints()
         except AssertionError as error:
             partition = self.net.partitions[partition_index]
-            prev_rsc = partition.get_resource_usage()
+            prev_rsc = partition_resource_usage(partition)
             prev_cycle = partition.get_cycle()
             partition.reduce_squeeze_fanout()
             partition.update()
             current_cycle = partition.get_cycle()
-            current_rsc = partition.get_resource_usage()
+            current_rsc = partition_resource_usage(partition)
             if current_rsc["LUT"] >= prev_rsc["LUT"] or current_cycle > prev_cycle:
-                self.net = net         
+                with self.profiler.phase("snapshot"):
+                    set_partition_snapshot(partition, snapshot)
     
     def empirical_solver(self, partition_index, optimiser_phase, fast_mode = True):
-        net = copy.deepcopy(self.net)
+        with self.profiler.phase("snapshot"):
+            snapshot = get_partition_snapshot(self.net.partitions[partition_index])
         reject_list = []
-        while True:
+        while not self.out_of_time():
             skip_second_slowest_node = True#self.merge_ongoing and optimiser_phase in [transforms.apply_more_coarse_favour_coarse_in, transforms.apply_more_coarse_favour_coarse_out]
             # skipping avoids some cases of local minima
             status, node = optimiser_phase(self.net.partitions[partition_index], reject_list, skip_second_slowest_node)
@@ -187,15 +347,20 @@ class GreedyPartition(Solver):
                 self.check_resources()
                 self.check_constraints()
 
-                net = copy.deepcopy(self.net)
+                with self.profiler.phase("snapshot"):
+                    snapshot = get_partition_snapshot(self.net.partitions[partition_index])
+                self.profiler.record_move(True)
             except AssertionError as error:
+                self.profiler.record_move(False)
                 if fast_mode: # break to save optimisation time
                     break
                 else:
                     reject_list.append(node)
-                    self.net = copy.deepcopy(net)
+                    with self.profiler.phase("snapshot"):
+                        set_partition_snapshot(self.net.partitions[partition_index], snapshot)
 
-        self.net = net
+        with self.profiler.phase("snapshot"):
+            set_partition_snapshot(self.net.partitions[partition_index], snapshot)
         self.net.update_partitions()
         #print(partition_index,"ultilised DSP:", self.partitions[partition_index].get_resource_usage()['DSP'])
 
@@ -205,7 +370,7 @@ class GreedyPartition(Solver):
 
         partition_dsp_product = []
 
-        for layer in graphs.ordered_node_list(partition.graph):
+        for layer in get_ordered_nodes(partition.graph):
             layer_dsp_product = []
             node_hw = copy.deepcopy(partition.graph.nodes[layer]['hw'])
             if partition.graph.nodes[layer]['type'] == LAYER_TYPE.Convolution:
@@ -240,23 +405,8 @@ class GreedyPartition(Solver):
                 layer_dsp_product = list(set(layer_dsp_product))
                 partition_dsp_product.append(layer_dsp_product)
 
-        if len(partition_dsp_product) < 5:
-            partition_dsp_combination = [0]
-            for layer_dsp_product in partition_dsp_product:
-                existing_dsp_combination = partition_dsp_combination
-                partition_dsp_combination = []
-                for dsp_combination in existing_dsp_combination:
-                    for dsp in layer_dsp_product:
-                        partition_dsp_combination.append(dsp_combination+dsp)
-                partition_dsp_combination = list(set(partition_dsp_combination))
-                partition_dsp_combination = sorted(partition_dsp_combination)
-
-            all_dsp_combination = list(filter(lambda x: x < (self.net.rsc_allocation*self.net.platform.get_dsp()), partition_dsp_combination))
-
-            max_dsp_combination = max(all_dsp_combination)
-        else:
-            print("Might lead to program hanging. Abort getting max dsp combination")
-            max_dsp_combination = int(self.net.rsc_allocation*self.net.platform.get_dsp())
+        max_dsp_combination = get_max_subset_sum(partition_dsp_product,
+                self.net.rsc_allocation*self.net.platform.get_dsp())
 
         return max_dsp_combination
 
@@ -270,24 +420,44 @@ class GreedyPartition(Solver):
         return all_wr_feasible
 
     def allocate_uram(self):
+        """
+        chooses which weight memories of each partition to store in URAM,
+        using as little URAM as possible to bring the partition's BRAM below
+        its allocation. The BRAM saved and URAM used by each layer are found
+        once per layer, and the choice is solved with `get_min_uram_selection`.
+        """
         if self.net.platform.get_uram() == 0:
             return
         # reset all uram flags
         for partition in self.net.partitions:
-            for layer in graphs.ordered_node_list(partition.graph):
+            for layer in get_ordered_nodes(partition.graph):
                 if partition.graph.nodes[layer]['type'] in [LAYER_TYPE.Convolution, LAYER_TYPE.InnerProduct]:
                     partition.graph.nodes[layer]["hw"].use_uram = False
 
         # balance between bram and uram
-        for partition in reversed(self.net.partitions):
-            for layer in reversed(graphs.ordered_node_list(partition.graph)):
-                if partition.graph.nodes[layer]['type'] in [LAYER_TYPE.Convolution, LAYER_TYPE.InnerProduct]:
-                    partition_resource_usage = partition.get_resource_usage()
-                    if partition_resource_usage['BRAM'] >= self.net.platform.get_bram() * self.net.rsc_allocation:
-                        partition.graph.nodes[layer]["hw"].use_uram = True
-                    else:
-                        break
-
+        bram_limit = self.net.platform.get_bram() * self.net.rsc_allocation
+        for partition in self.net.partitions:
+            bram = partition_resource_usage(partition)['BRAM']
+            if bram < bram_limit:
+                continue
+            # BRAM saved and URAM used by moving each layer to URAM
+            layers = [ layer for layer in get_ordered_nodes(partition.graph) \
+                    if partition.graph.nodes[layer]['type'] in [LAYER_TYPE.Convolution, LAYER_TYPE.InnerProduct] ]
+            bram_saved, uram_used = [], []
+            for layer in layers:
+                hw = partition.graph.nodes[layer]["hw"]
+                bram_resources = layer_resource_usage(hw)
+                hw.use_uram = True
+                uram_resources = layer_resource_usage(hw)
+                hw.use_uram = False
+                bram_saved.append(bram_resources['BRAM'] - uram_resources['BRAM'])
+                uram_used.append(uram_resources.get('URAM', 0) - bram_resources.get('URAM', 0))
+            # smallest saving that brings the BRAM below its allocation
+            required = math.floor(bram - bram_limit) + 1
+            for i in get_min_uram_selection(bram_saved, uram_used, required):
+                partition.graph.nodes[layers[i]]["hw"].use_uram = True
+
+    @profiled("run_solver")
     def run_solver(self, log=True):
         # update all partitions
         self.net.update_partitions()
@@ -308,58 +478,119 @@ class GreedyPartition(Solver):
 
         assert "partition" not in self.transforms
 
-        for partition_index in range(len(self.net.partitions)):
-            # don't use enumerate, copy.deepcopy creates the new partition object 
-            if not self.net.partitions[partition_index].need_optimise:
-                continue
+        # partitions to optimise
+        partition_indices = [ partition_index for partition_index in range(len(self.net.partitions)) \
+                if self.net.partitions[partition_index].need_optimise ]
 
-            max_dsp = self.get_max_dsp_combination(self.net.partitions[partition_index])
+        # optimise the partitions in parallel
+        if self.parallel_partitions and self.workers > 1 and len(partition_indices) > 1:
+            return self.optimise_partitions_parallel(partition_indices)
 
-            for phase in [transforms.apply_more_fine, transforms.apply_less_weight_reloading]:
-                self.empirical_solver(partition_index, phase)
+        for partition_index in partition_indices:
 
-            if "weights_reloading" in self.transforms and self.net.partitions[partition_index].wr_layer:
-                all_wr_feasible = self.get_all_wr_feasible(self.net.partitions[partition_index]) # TODO
-                sorted_wr_feasible = np.sort(all_wr_feasible)
-                sorted_wr_feasible = list(filter(lambda x: x>=self.net.partitions[partition_index].wr_factor, sorted_wr_feasible))
-            else:
-                sorted_wr_feasible = [1]
+            # stop at the deadline
+            if self.out_of_time():
+                break
 
-            for wr_factor in sorted_wr_feasible:
-                net = copy.deepcopy(self.net)
-                # get the current cost
-                cost = self.get_cost([partition_index])
+            # optimise the folding of the partition
+            self.optimise_partition(partition_index)
 
-                transforms.remove_weights_reloading_transform(self.net.partitions[partition_index])
-                self.net.partitions[partition_index].wr_factor = int(wr_factor)
-                transforms.apply_weights_reloading_transform(self.net.partitions[partition_index])
-                self.net.update_partitions()
+            # save a checkpoint of the current design
+            self.save_checkpoint()
 
-                if partition_index in self.coarse_in_first:
-                    coarse_phases = [transforms.apply_more_coarse_favour_coarse_in,
-                                     transforms.apply_more_coarse_fix_coarse_in]
-                else:
-                    coarse_phases = [transforms.apply_more_coarse_favour_coarse_out,
-                                     transforms.apply_more_coarse_fix_coarse_out]
+        return True
 
-                for phase in coarse_phases:
-                    self.empirical_solver(partition_index,phase)
-                    if self.net.partitions[partition_index].get_resource_usage()['DSP'] == max_dsp:
-                        break
+    def optimise_partition(self, partition_index):
+        """
+        greedily optimises the fine, weights reloading and coarse factors of a
+        single partition. Only this partition is changed.
+        """
+        max_dsp = self.get_max_dsp_combination(self.net.partitions[partition_index])
 
+        for phase in [transforms.apply_more_fine, transforms.apply_less_weight_reloading]:
+            self.empirical_solver(partition_index, phase)
 
-                if self.get_cost([partition_index]) >= cost:
-                    self.net = net
+        if "weights_reloading" in self.transforms and self.net.partitions[partition_index].wr_layer:
+            all_wr_feasible = self.get_all_wr_feasible(self.net.partitions[partition_index]) # TODO
+            sorted_wr_feasible = np.sort(all_wr_feasible)
+            sorted_wr_feasible = list(filter(lambda x: x>=self.net.partitions[partition_index].wr_factor, sorted_wr_feasible))
+        else:
+            sorted_wr_feasible = [1]
 
-                if self.net.partitions[partition_index].get_resource_usage()['DSP'] == max_dsp:
-                    break
+        for wr_factor in sorted_wr_feasible:
+            with self.profiler.phase("snapshot"):
+                snapshot = get_partition_snapshot(self.net.partitions[partition_index])
+            # get the current cost
+            cost = self.get_cost([partition_index])
 
-                if self.objective != 1:
+            transforms.remove_weights_reloading_transform(self.net.partitions[partition_index])
+            self.net.partitions[partition_index].wr_factor = int(wr_factor)
+            transforms.apply_weights_reloading_transform(self.net.partitions[partition_index])
+            self.net.update_partitions()
+
+            if partition_index in self.coarse_in_first:
+                coarse_phases = [transforms.apply_more_coarse_favour_coarse_in,
+                                 transforms.apply_more_coarse_fix_coarse_in]
+            else:
+                coarse_phases = [transforms.apply_more_coarse_favour_coarse_out,
+                                 transforms.apply_more_coarse_fix_coarse_out]
+
+            for phase in coarse_phases:
+                self.empirical_solver(partition_index,phase)
+                if partition_resource_usage(self.net.partitions[partition_index])['DSP'] == max_dsp:
                     break
 
-            print(partition_index,"single partition cost:",self.get_cost([partition_index]))
-            print("ultilised DSP:", self.net.partitions[partition_index].get_resource_usage()['DSP'],
-                  "max DSP:", max_dsp)
-            self.solver_status()
 
+            if self.get_cost([partition_index]) >= cost:
+                with self.profiler.phase("snapshot"):
+                    set_partition_snapshot(self.net.partitions[partition_index], snapshot)
+
+            if partition_resource_usage(self.net.partitions[partition_index])['DSP'] == max_dsp:
+                break
+
+            if self.objective != 1:
+                break
+
+        print(partition_index,"single partition cost:",self.get_cost([partition_index]))
+        print("ultilised DSP:", partition_resource_usage(self.net.partitions[partition_index])['DSP'],
+              "max DSP:", max_dsp)
+        self.solver_status()
+
+    def optimise_partitions_parallel(self, partition_indices):
+        """
+        optimises each of the given partitions in a separate worker process,
+        and merges the optimised partitions back into the network. The other
+        partitions of a worker are not changed, so it only checks the
+        resources of its own partition, and the constraints of the network
+        are checked after merging. Returns whether the merged network meets
+        the constraints.
+        """
+        # send the current design to the workers once, without the constraints
+        with self.profiler.phase("pickle"):
+            design = pickle.dumps(dataclasses.replace(self, checkpoint_path=None,
+                best_design=None, profiler=Profiler(), constraints={
+                    'latency'    : float("inf"), 'throughput' : 0.0}))
+
+        # optimise the partitions
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(optimise_partition, [design]*len(partition_indices),
+                    partition_indices)
+            for partition_index, partition, profiler in results:
+                self.profiler.merge(profiler)
+                self.net.partitions[partition_index] = partition
+
+        # update the merged network
+        self.net.update_partitions()
+        self.allocate_uram()
+        self.solver_status()
+
+        # save a checkpoint of the current design
+        self.save_checkpoint()
+
+        # check the constraints of the merged network
+        try:
+            self.check_constraints()
+        except AssertionError as error:
+            print(error)
+            return False
         return True
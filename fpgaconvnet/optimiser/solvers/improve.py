@@ -8,6 +8,11 @@ from dataclasses import dataclass
 import numpy as np
 
 from fpgaconvnet.optimiser.solvers import Solver
+from fpgaconvnet.optimiser.solvers.state import UndoLog
+from fpgaconvnet.optimiser.solvers.sampling import SumTree
+from fpgaconvnet.optimiser.cache import layer_latency, partition_latency
+from fpgaconvnet.optimiser.transforms.helper import mark_dirty
+from fpgaconvnet.optimiser.profiler import profiled
 
 LATENCY   =0
 THROUGHPUT=1
@@ -21,11 +26,22 @@ class Improve(Solver):
     T_min: float = 0.0001
     cool: float = 0.97
     iterations: int = 10
+    adaptive_cooling: bool = False
+    cool_min: float = 0.8
+    cooling_lambda: float = 0.7
+    cooling_window: int = 20
+    target_acceptance: float = 0.4
+    stagnation_window: int = 0
 
     """
-    Chooses the hardware component causing a bottleneck and performs the same decision as simulated annealing
+    Chooses the hardware component causing a bottleneck and performs the same decision as simulated annealing, with the same cooling schedule
     """
 
+    # cooling schedule
+    from fpgaconvnet.optimiser.solvers.cooling import reset_schedule
+    from fpgaconvnet.optimiser.solvers.cooling import update_temperature
+    from fpgaconvnet.optimiser.solvers.cooling import is_stagnated
+
     # def solver_status(self):
     #     # objective
     #     objectives = ['latency','throughput']
@@ -42,6 +58,69 @@ class Improve(Solver):
     #     print("TEMP:\t {temp}, COST:\t {cost} ({objective}), RESOURCE:\t {BRAM}\t{DSP}\t{LUT}\t{FF}\t(BRAM|DSP|LUT|FF)".format(
     #         temp=self.T,cost=cost,objective=objective,BRAM=int(BRAM),DSP=int(DSP),LUT=int(LUT),FF=int(FF)),end='\n')#,end='\r')
 
+    def build_partition_tree(self):
+        """
+        builds the sum tree of partition latencies used to sample the
+        bottleneck partitions, and discards the node sum trees
+        """
+        freq = self.net.platform.board_freq
+        self.partition_tree = SumTree([ partition_latency(partition, freq) \
+                for partition in self.net.partitions ])
+        self.node_trees = {}
+
+    def get_node_tree(self, partition_index):
+        """
+        returns the nodes of a partition, their indices and the sum tree of
+        their latencies, building it if the partition has changed
+        """
+        partition = self.net.partitions[partition_index]
+        if id(partition) not in self.node_trees:
+            nodes = list(partition.graph.nodes())
+            self.node_trees[id(partition)] = (nodes, { node: i for i, node in enumerate(nodes) },
+                    SumTree([ layer_latency(partition.graph.nodes[node]["hw"]) for node in nodes ]))
+        return self.node_trees[id(partition)]
+
+    def update_latencies(self, transform, partition_index, node):
+        """
+        updates the sampling weights changed by a transform. Node transforms
+        only change the latency of their node and partition, whereas
+        partition transforms change the partition structure.
+        """
+        if transform == "partition" or len(self.partition_tree) != len(self.net.partitions):
+            self.build_partition_tree()
+            return
+        # update the partition's latency
+        partition = self.net.partitions[partition_index]
+        self.partition_tree.update(partition_index,
+                partition_latency(partition, self.net.platform.board_freq))
+        # update the node's latency
+        if transform in ["coarse", "fine"] and id(partition) in self.node_trees:
+            _, indices, node_tree = self.node_trees[id(partition)]
+            node_tree.update(indices[node], layer_latency(partition.graph.nodes[node]["hw"]))
+        else:
+            self.node_trees.pop(id(partition), None)
+
+    def rollback(self):
+        """
+        undoes the moves of this iteration, and restores the sampling weights
+        of the partitions they touched
+        """
+        structural = self.undo_log.partitions is not None
+        touched = [ id(partition) for partition, _ in self.undo_log.entries.values() ]
+        self.undo_log.rollback(self.net)
+        self.update_partitions()
+        # rebuild the sum trees if the partition structure changed
+        if structural or len(self.partition_tree) != len(self.net.partitions):
+            self.build_partition_tree()
+            return
+        # otherwise only update the touched partitions
+        freq = self.net.platform.board_freq
+        for partition_index, partition in enumerate(self.net.partitions):
+            if id(partition) in touched:
+                self.partition_tree.update(partition_index, partition_latency(partition, freq))
+                self.node_trees.pop(id(partition), None)
+
+    @profiled("run_solver")
     def run_solver(self, log=True):
 
         # update all partitions
@@ -88,46 +167,55 @@ class Improve(Solver):
             print("ERROR: Exceeds resource usage")
             return
 
+        # keep the starting point as the best design so far
+        self.record_best()
+
+        # latencies for sampling the bottleneck partitions and nodes
+        self.update_partitions()
+        self.build_partition_tree()
+
+        # start the cooling schedule
+        self.reset_schedule()
+
         # Cooling Loop
-        while self.T_min < self.T:
+        while self.T_min < self.T and not self.out_of_time():
 
             # update partitions
-            self.net.update_partitions()
+            self.update_partitions()
 
             # get the current cost
             cost = self.get_cost()
 
-            # Save previous iteration
-            net = copy.deepcopy(self.net)
+            # record the moves of this iteration, so they can be undone
+            self.undo_log = UndoLog()
 
             # several iterations per cool down
             for _ in range(self.iterations):
 
-                # update partitions
-                self.net.update_partitions()
-
-                # remove all auxiliary layers
-                for partition in self.net.partitions:
-                    partition.remove_squeeze()
-
                 # Apply a transform
                 ## Choose a random transform
                 transform = random.choice(self.transforms)
 
                 ## Choose slowest partition
-                partition_latencys = [ partition.get_latency(self.net.platform.board_freq) for partition in self.net.partitions ]
-                partition_index    = np.random.choice(np.arange(len(self.net.partitions)), 1, p=(partition_latencys/sum(partition_latencys)))[0]
+                partition_index = self.partition_tree.sample()
+
+                ## remove auxiliary layers of the partition
+                with self.profiler.phase("remove_squeeze"):
+                    self.net.partitions[partition_index].remove_squeeze()
+                mark_dirty(self.net.partitions[partition_index])
 
                 ## Choose slowest node in partition
-                node_latencys = np.array([ self.net.partitions[partition_index].graph.nodes[layer]['hw'].latency() \
-                        for layer in self.net.partitions[partition_index].graph.nodes() ])
-                node = np.random.choice(list(self.net.partitions[partition_index].graph.nodes()), 1, p=(node_latencys/sum(node_latencys)))[0]
+                nodes, _, node_tree = self.get_node_tree(partition_index)
+                node = nodes[node_tree.sample()]
 
                 ## Apply the transform
                 self.apply_transform(transform, partition_index, node)
 
-                ## Update partitions
-                self.net.update_partitions()
+                ## Update the changed partitions
+                self.update_partitions()
+
+                ## Update the sampling weights
+                self.update_latencies(transform, partition_index, node)
 
             # Check resources
             try:
@@ -135,16 +223,38 @@ class Improve(Solver):
                 self.check_constraints()
             except AssertionError:
                 # revert to previous state
-                self.net = net
+                self.rollback()
+                self.profiler.record_move(False)
                 continue
 
             # Simulated annealing descision
+            accepted = True
             if math.exp(min(0,(cost - self.get_cost())/(self.k*self.T))) < random.uniform(0,1):
                 # revert to previous state
-                self.net = net
+                self.rollback()
+                accepted = False
+            self.profiler.record_move(accepted)
 
             # print out solver status
             self.solver_status()
 
+            # keep the best design
+            cost = self.get_cost()
+            self.record_best(cost)
+
             # reduce temperature
-            self.T *= self.cool
+            self.update_temperature(cost, accepted)
+
+            # save a checkpoint of the current design
+            self.save_checkpoint()
+
+            # stop once the cost has converged
+            if self.is_stagnated(cost):
+                print(f"Stopping, cost has not improved for {self.stagnation_window} steps")
+                break
+
+        # stop recording moves
+        self.undo_log = None
+
+        # finish with the best design found
+        self.restore_best()
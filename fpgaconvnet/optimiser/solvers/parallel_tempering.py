@@ -0,0 +1,162 @@
+import random
+import math
+import dataclasses
+import numpy as np
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+
+from fpgaconvnet.optimiser.solvers.simulated_annealing import SimulatedAnnealing
+from fpgaconvnet.optimiser.profiler import Profiler, profiled
+
+# solver that the chains of this worker process run on
+chain_solver = None
+
+def init_chain(solver):
+    """
+    keeps the solver that the chains of this worker process run on. This is
+    the initializer of the worker pool, so the solver and its network are
+    only sent to each worker once.
+    """
+    global chain_solver
+    chain_solver = solver
+
+def run_chain(design, temperature, seed, steps):
+    """
+    runs `steps` annealing steps at a fixed temperature, starting from a
+    design taken with `get_partitions_state`. This is executed in a worker
+    process, on the solver given to `init_chain`. Returns the final design
+    and its cost, the best design visited by the chain (or `None` if none
+    improved on the starting one) and its cost, and the chain's profile.
+    """
+    solver = chain_solver
+
+    # start from the given design
+    solver.set_partitions_state(design)
+
+    # seed the worker from the main process
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+
+    # profile the chain separately
+    solver.profiler = Profiler()
+
+    # cost of the starting state
+    cost = solver.get_cost()
+    solver.best_cost, solver.best_design = cost, None
+
+    # run the chain
+    for _ in range(steps):
+        if solver.anneal_step(temperature):
+            cost = solver.get_cost()
+            # keep the best state of the chain
+            solver.record_best(cost)
+
+    # stop recording moves
+    solver.undo_log = None
+
+    # get the final and best designs of the chain
+    design = solver.get_partitions_state()
+    best_design = None
+    if solver.best_design is not None:
+        solver.set_design(solver.best_design)
+        best_design = solver.get_partitions_state()
+
+    return design, cost, best_design, solver.best_cost, solver.profiler
+
+@dataclass
+class ParallelTempering(SimulatedAnnealing):
+    chains: int = 4
+    exchange_interval: int = 10
+    exchanges: int = 100
+    workers: int = None
+    seed: int = 0
+    """
+Runs several simulated annealing chains in parallel, each at a fixed temperature spaced geometrically between `T` and `T_min`. Every `exchange_interval` annealing steps, neighbouring chains swap their designs based on the parallel tempering exchange criterion, so that good designs found by the hot chains are refined by the cold ones. The chains are run in a pool of `workers` processes (one per chain by default), and all randomness is derived from `seed`.
+    """
+
+    def get_temperatures(self):
+        """
+        returns the temperature of each chain, from hottest to coldest
+        """
+        if self.chains == 1:
+            return [ self.T_min ]
+        return [ self.T*(self.T_min/self.T)**(i/(self.chains-1)) \
+                for i in range(self.chains) ]
+
+    def exchange(self, rng, temperatures, designs, costs, offset):
+        """
+        attempts to swap the designs of neighbouring chains, starting from
+        the chain at `offset`. A swap is accepted with probability
+        `min(1, exp((1/kT_i - 1/kT_j)(E_i - E_j)))`.
+        """
+        for i in range(offset, self.chains-1, 2):
+            j = i+1
+            delta = (1/(self.k*temperatures[i]) - 1/(self.k*temperatures[j])) * \
+                    (costs[i] - costs[j])
+            if delta >= 0 or math.exp(delta) > rng.uniform(0,1):
+                designs[i], designs[j] = designs[j], designs[i]
+                costs[i], costs[j] = costs[j], costs[i]
+
+    @profiled("run_solver")
+    def run_solver(self, log=True):
+
+        # update all partitions
+        self.net.update_partitions()
+
+        # Setup
+        if not self.find_starting_point():
+            return
+        self.update_partitions()
+
+        # random number generator for the seeds and exchanges
+        rng = random.Random(self.seed)
+
+        # initialise every chain from the starting point
+        temperatures = self.get_temperatures()
+        designs = [ self.get_partitions_state() ]*self.chains
+        costs = [ self.get_cost() ]*self.chains
+
+        # keep the starting point as the best design so far
+        self.record_best(costs[0])
+
+        # solver sent to each worker once, without the state of this one
+        solver = dataclasses.replace(self, checkpoint_path=None, best_design=None,
+                profiler=Profiler(), undo_log=None)
+
+        with ProcessPoolExecutor(max_workers=self.workers or self.chains,
+                initializer=init_chain, initargs=(solver,)) as executor:
+            for exchange_round in range(self.exchanges):
+
+                # stop at the deadline
+                if self.out_of_time():
+                    break
+
+                # run all chains for an exchange interval
+                jobs = [ executor.submit(run_chain, designs[i], temperatures[i],
+                    rng.randrange(2**32), self.exchange_interval) \
+                            for i in range(self.chains) ]
+
+                # gather the results, in chain order
+                for i, job in enumerate(jobs):
+                    designs[i], costs[i], chain_best_design, chain_best_cost, profiler = job.result()
+                    self.profiler.merge(profiler)
+                    # update the solver with the best design
+                    if chain_best_design is not None and chain_best_cost < self.best_cost:
+                        self.set_partitions_state(chain_best_design)
+                        self.record_best(chain_best_cost)
+
+                # swap states between neighbouring chains
+                self.exchange(rng, temperatures, designs, costs, exchange_round%2)
+
+                # wandb logging
+                self.wandb_log(exchange_round=exchange_round)
+
+                # print solver status
+                self.solver_status()
+
+                # save a checkpoint of the best design
+                self.save_checkpoint()
+
+        # finish with the best design found
+        self.restore_best()
+
@@ -0,0 +1,73 @@
+"""
+Weighted sampling with weights that change a few at a time, such as the
+latencies of the partitions and layers that a solver is transforming.
+"""
+
+import numpy as np
+
+class SumTree:
+    """
+    Fenwick tree of non-negative weights. Updating a weight and sampling an
+    index in proportion to its weight are both O(log n), rather than the
+    O(n) of recomputing all the probabilities for `np.random.choice`.
+    """
+
+    def __init__(self, weights):
+        self.weights = [ float(weight) for weight in weights ]
+        # build the tree in linear time
+        self.tree = [ 0.0 ] + self.weights
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def __len__(self):
+        return len(self.weights)
+
+    def __getitem__(self, index):
+        return self.weights[index]
+
+    def total(self):
+        """
+        returns the sum of all the weights
+        """
+        total, i = 0.0, len(self.weights)
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def update(self, index, weight):
+        """
+        sets the weight at the given index
+        """
+        delta = float(weight) - self.weights[index]
+        self.weights[index] = float(weight)
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        """
+        returns the index whose range of the cumulative weights contains the
+        given value, skipping any zero weights
+        """
+        index, step = 0, 1 << (len(self.weights).bit_length() - 1)
+        while step > 0:
+            if index + step < len(self.tree) and self.tree[index + step] <= value:
+                index += step
+                value -= self.tree[index]
+            step >>= 1
+        # guard against rounding past the last non-zero weight
+        index = min(index, len(self.weights) - 1)
+        while index > 0 and self.weights[index] == 0:
+            index -= 1
+        return index
+
+    def sample(self):
+        """
+        returns a random index, chosen in proportion to its weight
+        """
+        return self.find(np.random.uniform(0, self.total()))
+
@@ -4,16 +4,69 @@ import json
 import copy
 import random
 import math
+import pickle
+import contextlib
+import dataclasses
 from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
 import wandb
 
 from fpgaconvnet.optimiser.solvers import Solver
+from fpgaconvnet.optimiser.solvers.state import UndoLog
+from fpgaconvnet.optimiser.transforms.helper import mark_dirty
+from fpgaconvnet.optimiser.profiler import Profiler, profiled
 
 LATENCY   =0
 THROUGHPUT=1
 
 START_LOOP=1000
 
+# solver of this worker process, and the number of accepted moves applied to it
+worker_solver = None
+worker_moves = 0
+
+def init_worker(design):
+    """
+    unpickles the solver that this worker process evaluates candidates on.
+    This is the initializer of the worker pool, so the design is only sent
+    to each worker once.
+    """
+    global worker_solver, worker_moves
+    worker_solver, worker_moves = pickle.loads(design), 0
+
+def evaluate_candidate(moves, seed):
+    """
+    brings the worker's solver up to date by replaying the seeds of the
+    accepted `moves` it has not applied yet, and then applies the random
+    moves of the given seed. Returns the seed along with the cost of the new
+    design, or `None` if it is infeasible. The moves of the candidate are
+    undone, so the worker stays at the current design. This is executed in a
+    worker process.
+    """
+    global worker_moves
+    solver = worker_solver
+
+    # apply the moves accepted since the last candidate
+    for accepted in moves[worker_moves:]:
+        solver.apply_seeded_moves(accepted)
+    worker_moves = len(moves)
+
+    # evaluate the candidate
+    solver.undo_log = UndoLog()
+    solver.apply_seeded_moves(seed)
+    try:
+        solver.check_resources()
+        solver.check_constraints()
+        cost = solver.get_cost()
+    except AssertionError:
+        cost = None
+
+    # revert to the current design
+    solver.undo_log.rollback(solver.net)
+    solver.undo_log = None
+    solver.update_partitions()
+    return seed, cost
+
 @dataclass
 class SimulatedAnnealing(Solver):
     T: float = 10.0
@@ -21,109 +74,258 @@ class SimulatedAnnealing(Solver):
     T_min: float = 0.0001
     cool: float = 0.97
     iterations: int = 10
+    candidates: int = 1
+    workers: int = 1
+    adaptive_cooling: bool = False
+    cool_min: float = 0.8
+    cooling_lambda: float = 0.7
+    cooling_window: int = 20
+    target_acceptance: float = 0.4
+    stagnation_window: int = 0
     """
-Randomly chooses a transform and hardware component to change. The change is accepted based on a probability-based decision function
+Randomly chooses a transform and hardware component to change. The change is accepted based on a probability-based decision function. If `candidates` is greater than one, each step evaluates that many candidate changes across `workers` processes, and the first of them accepted in turn by the decision function is kept. If `adaptive_cooling` is set, the temperature is reduced by between `cool_min` and `cool` depending on the spread of the cost and the acceptance rate over the last `cooling_window` steps. If `stagnation_window` is non-zero, the run stops once the best cost has not improved for that many steps.
     """
 
-    def run_solver(self, log=True):
+    # cooling schedule
+    from fpgaconvnet.optimiser.solvers.cooling import reset_schedule
+    from fpgaconvnet.optimiser.solvers.cooling import update_temperature
+    from fpgaconvnet.optimiser.solvers.cooling import is_stagnated
 
-        # update all partitions
-        self.net.update_partitions()
+    def find_starting_point(self):
+        """
+        applies random transforms until the design fits on the platform.
+        Returns whether a feasible starting point was found.
+        """
+        try:
+            self.check_resources()
+            self.check_constraints()
+            return True
+        except AssertionError as error:
+            print("WARNING: Exceeds resource usage (trying to find valid starting point)")
 
-        # Setup
+        # Attempt to find a good starting point
+        for i in range(START_LOOP):
+            if self.out_of_time():
+                break
+            transform = random.choice(self.transforms)
+            self.apply_transform(transform)
+            self.net.update_partitions()
+
+            try:
+                self.check_resources()
+                self.check_constraints()
+                return True
+            except AssertionError as error:
+                pass
+
+        print("ERROR: Exceeds resource usage")
+        return False
+
+    def apply_random_moves(self):
+        """
+        applies `iterations` random transforms to random nodes of the network
+        """
+        for _ in range(self.iterations):
+
+            # Apply a transform
+            ## Choose a random transform
+            transform = random.choice(self.transforms)
+
+            ## Choose a random partition
+            partition_index = random.randint(0,len(self.net.partitions)-1)
+
+            ## remove auxiliary layers of the partition
+            with self.profiler.phase("remove_squeeze"):
+                self.net.partitions[partition_index].remove_squeeze()
+            mark_dirty(self.net.partitions[partition_index])
+
+            ## Choose a random node in partition
+            node = random.choice(list(self.net.partitions[partition_index].graph))
+
+            ## Apply the transform
+            self.apply_transform(transform, partition_index, node)
+
+            ## Update the changed partitions
+            self.update_partitions()
+
+    def apply_seeded_moves(self, seed):
+        """
+        applies the random moves generated from the given seed, without
+        changing the state of the solver's random number generator. The same
+        seed applied to the same design always gives the same moves.
+        """
+        state = random.getstate()
+        random.seed(seed)
+        try:
+            self.apply_random_moves()
+        finally:
+            random.setstate(state)
+
+    def anneal_step(self, temperature, executor=None):
+        """
+        applies `iterations` random transforms and accepts the result based
+        on the annealing decision function at the given temperature.
+        Returns whether the new design was feasible, as infeasible designs
+        are always reverted. If an executor is given and `candidates` is
+        greater than one, a batch of candidate moves is evaluated instead.
+        """
+        if executor is not None and self.candidates > 1:
+            return self.anneal_step_batch(temperature, executor)
+
+        # update partitions
+        self.update_partitions()
+
+        # get the current cost
         cost = self.get_cost()
 
-        start = False
+        # record the moves of this iteration, so they can be undone
+        self.undo_log = UndoLog()
+
+        # several iterations per cool down
+        self.apply_random_moves()
 
+        # Check resources
         try:
             self.check_resources()
             self.check_constraints()
-            start = True
-        except AssertionError as error:
-            print("WARNING: Exceeds resource usage (trying to find valid starting point)")
+        except AssertionError:
+            # revert to previous state
+            self.undo_log.rollback(self.net)
+            self.update_partitions()
+            self.profiler.record_move(False)
+            return False
 
-        # Attempt to find a good starting point
-        if not start:
-            for i in range(START_LOOP):
-                transform = random.choice(self.transforms)
-                self.apply_transform(transform)
-                self.net.update_partitions()
-
-                try:
-                    self.check_resources()
-                    self.check_constraints()
-                    break
-                except AssertionError as error:
-                    pass
+        # Simulated annealing descision
+        if math.exp(min(0,(cost - self.get_cost())/(self.k*temperature))) < random.uniform(0,1):
+            # revert to previous state
+            self.undo_log.rollback(self.net)
+            self.update_partitions()
+            self.profiler.record_move(False)
+        else:
+            self.profiler.record_move(True)
+
+        return True
+
+    def anneal_step_batch(self, temperature, executor):
+        """
+        evaluates `candidates` independent sets of random moves from the
+        current design in parallel, and applies the annealing decision
+        function to each feasible candidate in seed order, keeping the first
+        one accepted. Each candidate is identified by the seed of its moves,
+        so only the accepted one is replayed here. The workers replay the
+        seeds in `accepted_moves` to follow the current design.
+        """
+        # update partitions
+        self.update_partitions()
+
+        # get the current cost
+        cost = self.get_cost()
+
+        # evaluate the candidates
+        seeds = [ random.randrange(2**32) for _ in range(self.candidates) ]
+        results = executor.map(evaluate_candidate,
+                [self.accepted_moves]*len(seeds), seeds)
+        results = [ (seed, new_cost) for seed, new_cost in results if new_cost is not None ]
+
+        # no feasible candidates
+        if not results:
+            self.profiler.record_move(False)
+            return False
 
+        # Simulated annealing descision, on each candidate in turn
+        for seed, new_cost in results:
+            if math.exp(min(0,(cost - new_cost)/(self.k*temperature))) >= random.uniform(0,1):
+                break
+        else:
+            self.profiler.record_move(False)
+            return True
+
+        # replay the moves of the accepted candidate
+        self.undo_log = UndoLog()
+        self.apply_seeded_moves(seed)
         try:
             self.check_resources()
             self.check_constraints()
-        except AssertionError as error:
-            print("ERROR: Exceeds resource usage")
+        except AssertionError:
+            # revert to previous state
+            self.undo_log.rollback(self.net)
+            self.update_partitions()
+            self.profiler.record_move(False)
+            return False
+        self.accepted_moves.append(seed)
+        self.profiler.record_move(True)
+
+        return True
+
+    @profiled("run_solver")
+    def run_solver(self, log=True):
+
+        # update all partitions
+        self.net.update_partitions()
+
+        # Setup
+        if not self.find_starting_point():
             return
 
-        # Cooling Loop
-        while self.T_min < self.T:
+        # seeds of the accepted candidate moves, replayed by the workers
+        self.accepted_moves = []
 
-            # update partitions
-            self.net.update_partitions()
+        # the starting design, sent to each worker of the pool once
+        if self.candidates > 1:
+            with self.profiler.phase("pickle"):
+                design = pickle.dumps(dataclasses.replace(self, checkpoint_path=None,
+                    best_design=None, profiler=Profiler(), undo_log=None))
 
-            # get the current cost
-            cost = self.get_cost()
+        # worker pool for evaluating candidate moves
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                initargs=(design,)) if self.candidates > 1 else \
+                contextlib.nullcontext() as executor:
 
-            # wandb logging and checkpoint
-            self.wandb_log(temperature=self.T)
-            # self.wandb_checkpoint()
+            # keep the starting point as the best design so far
+            self.record_best()
 
-            # Save previous iteration
-            net = copy.deepcopy(self.net)
+            # start the cooling schedule
+            self.reset_schedule()
 
-            # several iterations per cool down
-            for _ in range(self.iterations):
+            # Cooling Loop
+            while self.T_min < self.T and not self.out_of_time():
 
                 # update partitions
-                self.net.update_partitions()
-
-                # remove all auxiliary layers
-                for i in range(len(self.net.partitions)):
-                    self.net.partitions[i].remove_squeeze()
+                self.update_partitions()
 
-                # Apply a transform
-                ## Choose a random transform
-                transform = random.choice(self.transforms)
+                # wandb logging and checkpoint
+                self.wandb_log(temperature=self.T)
+                # self.wandb_checkpoint()
 
-                ## Choose a random partition
-                partition_index = random.randint(0,len(self.net.partitions)-1)
+                # perform the moves of this temperature
+                accepted = self.profiler.accepted
+                if not self.anneal_step(self.T, executor):
+                    continue
+                accepted = self.profiler.accepted > accepted
 
-                ## Choose a random node in partition
-                node = random.choice(list(self.net.partitions[partition_index].graph))
+                # print solver status
+                self.solver_status()
 
-                ## Apply the transform
-                self.apply_transform(transform, partition_index, node)
+                # keep the best design
+                cost = self.get_cost()
+                self.record_best(cost)
 
-                ## Update partitions
-                self.net.update_partitions()
+                # reduce temperature
+                self.update_temperature(cost, accepted)
 
-            # Check resources
-            try:
-                self.check_resources()
-                self.check_constraints()
-            except AssertionError:
-                # revert to previous state
-                self.net = net
-                continue
+                # save a checkpoint of the current design
+                self.save_checkpoint()
 
-            # Simulated annealing descision
-            if math.exp(min(0,(cost - self.get_cost())/(self.k*self.T))) < random.uniform(0,1):
-                # revert to previous state
-                self.net = net
+                # stop once the cost has converged
+                if self.is_stagnated(cost):
+                    print(f"Stopping, cost has not improved for {self.stagnation_window} steps")
+                    break
 
-            # print solver status
-            self.solver_status()
+        # stop recording moves
+        self.undo_log = None
 
-            # reduce temperature
-            self.T *= self.cool
+        # finish with the best design found
+        self.restore_best()
 
         # # store dataframe of
         # # https://docs.wandb.ai/guides/data-vis/log-tables
@@ -3,23 +3,33 @@ import copy
 import random
 import math
 import numpy as np
+import dataclasses
 from dataclasses import dataclass, field
 import wandb
-import uuid
-import pickle
+import networkx as nx
+import time
 from datetime import datetime
 
 LATENCY   =0
 THROUGHPUT=1
 
 from fpgaconvnet.models.network import Network
+from fpgaconvnet.models.partition import Partition
 
 import fpgaconvnet.optimiser.transforms.weights_reloading as weights_reloading
 import fpgaconvnet.optimiser.transforms.partition as partition
 import fpgaconvnet.optimiser.transforms.coarse as coarse
 import fpgaconvnet.optimiser.transforms.fine as fine
+from fpgaconvnet.optimiser.transforms.helper import mark_dirty, get_ordered_nodes
+import fpgaconvnet.tools.graphs as graphs
 from fpgaconvnet.tools.layer_enum import LAYER_TYPE
 
+from fpgaconvnet.optimiser.solvers.state import UndoLog, serialise, UNSERIALISABLE, get_attribute_state, \
+        set_layer_state, get_rng_state, set_rng_state, write_checkpoint, \
+        get_network_snapshot, set_network_snapshot
+from fpgaconvnet.optimiser.cache import model_cache, partition_key, partition_resource_usage
+from fpgaconvnet.optimiser.profiler import Profiler, profiled
+
 @dataclass
 class Solver:
     net: Network
@@ -28,6 +38,13 @@ class Solver:
         'latency'    : float("inf"), 'throughput' : 0.0})
     transforms: list = field(default_factory=lambda:[
         'coarse','fine','partition', 'weights_reloading'])
+    undo_log: UndoLog = field(default=None, repr=False)
+    checkpoint_path: str = None
+    checkpoints_kept: int = 5
+    profiler: Profiler = field(default_factory=Profiler, repr=False)
+    deadline: float = None
+    best_cost: float = field(default=float("inf"), repr=False)
+    best_design: dict = field(default=None, repr=False)
 
     """
     Base class for all optimisation strategies. This inherits the `Network` class.
@@ -41,6 +58,23 @@ class Solver:
     transforms: list
         list of transforms that can be applied to the network. Allowed transforms
         are `['coarse','fine','partition','weights_reloading']`
+    undo_log: UndoLog
+        if set, `apply_transform` records the changes it makes so that they
+        can be rolled back.
+    checkpoint_path: str
+        if set, directory that `save_checkpoint` writes checkpoints to.
+    checkpoints_kept: int
+        number of most recent checkpoints kept in `checkpoint_path`.
+    profiler: Profiler
+        accumulates the time spent in each phase of the solver.
+    deadline: float
+        if set, time (as given by `time.time()`) at which the solver stops
+        searching.
+    best_cost: float
+        cost of the best feasible design found so far.
+    best_design: dict
+        snapshot of the best feasible design found so far, which is
+        restored at the end of a run.
     """
 
         # self.transforms_config = transforms_config
@@ -52,12 +86,51 @@ class Solver:
     # import optimiser utilities
     from fpgaconvnet.optimiser.solvers.utils import starting_point_distillation
 
+    def out_of_time(self):
+        """
+        returns whether the solver has passed its deadline
+        """
+        return self.deadline is not None and time.time() > self.deadline
+
+    def get_design(self):
+        """
+        returns a lightweight snapshot of the current design
+        """
+        return get_network_snapshot(self.net)
+
+    def set_design(self, design):
+        """
+        restores the design from a snapshot taken with `get_design`
+        """
+        set_network_snapshot(self.net, design)
+        self.update_partitions()
+
+    def record_best(self, cost=None):
+        """
+        keeps a snapshot of the current design if it is the best found so
+        far. The current design must be feasible.
+        """
+        if cost is None:
+            cost = self.get_cost()
+        if cost < self.best_cost:
+            with self.profiler.phase("snapshot"):
+                self.best_cost, self.best_design = cost, self.get_design()
+
+    def restore_best(self):
+        """
+        restores the best design found, if it is better than the current one
+        """
+        if self.best_design is not None and self.best_cost < self.get_cost():
+            with self.profiler.phase("snapshot"):
+                self.set_design(self.best_design)
+
     def get_transforms(self):
         self.transforms = []
         for transform_type, attr in self.transforms_config.items():
             if bool(attr["apply_transform"]):
                 self.transforms.append(transform_type)
 
+    @profiled("get_cost")
     def get_cost(self, partition_list=None):
         """
         calculates the cost function of the optimisation strategy at it's current state.
@@ -76,13 +149,30 @@ class Solver:
             partition_list = list(range(len(self.net.partitions)))
         # Latency objective
         if   self.objective == LATENCY:
-            return self.net.get_latency(partition_list)
+            evaluate = lambda: self.net.get_latency(partition_list)
         # Throughput objective
         elif self.objective == THROUGHPUT:
-            return -self.net.get_throughput(partition_list)
+            evaluate = lambda: -self.net.get_throughput(partition_list)
+        else:
+            return None
+        # get the cached cost of the partitions
+        key = (self.objective, self.net.batch_size, tuple(
+            partition_key(self.net.partitions[i]) for i in partition_list))
+        return model_cache.lookup("cost", key, evaluate)
 
+    @profiled("check_resources")
     def check_resources(self):
-        self.net.check_resources()
+        def evaluate():
+            try:
+                self.net.check_resources()
+            except AssertionError as error:
+                return str(error)
+        # get the cached result of the resource check
+        key = (self.net.rsc_allocation, tuple(
+            partition_key(partition) for partition in self.net.partitions))
+        error = model_cache.lookup("check_resources", key, evaluate)
+        if error is not None:
+            raise AssertionError(error)
 
     def check_constraints(self):
         """
@@ -99,6 +189,7 @@ class Solver:
         assert self.net.get_throughput() >= self.constraints['throughput'], \
                 "ERROR : (constraint violation) Throughput constraint exceeded"
 
+    @profiled("apply_transform", per_transform=True)
     def apply_transform(self, transform, partition_index=None, node=None,
             iteration=None, cooltimes=None):
         """
@@ -124,9 +215,13 @@ class Solver:
 
         # choose random node in partition if given
         if node == None:
-            node = random.choice(graphs.ordered_node_list(
+            node = random.choice(get_ordered_nodes(
                 self.net.partitions[partition_index].graph))
 
+        # record the partitions this transform changes
+        if self.undo_log is not None:
+            self.record_transform(transform, partition_index)
+
         # Apply a random transform
         ## Coarse transform (node_info transform)
         if transform == 'coarse':
@@ -144,18 +239,72 @@ class Solver:
         if transform == 'weights_reloading':
             ### apply random weights reloading
             weights_reloading.apply_random_weights_reloading(
-                self.net, partition_index)
+                self.net.partitions[partition_index])
             return
 
         ## Partition transform (partition transform)
         if transform == 'partition':
             ### apply random partition
             # remove squeeze layers prior to partitioning
-            self.net.partitions[partition_index].remove_squeeze()
+            for i in self.get_partition_neighbourhood(partition_index):
+                with self.profiler.phase("remove_squeeze"):
+                    self.net.partitions[i].remove_squeeze()
+                mark_dirty(self.net.partitions[i])
             partition.apply_random_partition(
                 self.net, partition_index)
             return
 
+    def record_transform(self, transform, partition_index):
+        """
+        records the state of the partitions that the given transform can
+        change in `self.undo_log`. Node transforms only change their own
+        partition, whereas partition transforms can change the neighbouring
+        partitions and the partition structure.
+        """
+        # node and weights reloading transforms
+        if transform in ['coarse', 'fine', 'weights_reloading']:
+            self.undo_log.record_partition(self.net.partitions[partition_index])
+            return
+        # partition transforms
+        if transform == 'partition':
+            self.undo_log.record_partition_list(self.net)
+            for i in self.get_partition_neighbourhood(partition_index):
+                self.undo_log.record_partition(self.net.partitions[i])
+
+    def get_partition_neighbourhood(self, partition_index):
+        """
+        returns the indices of the partitions that a partition transform
+        applied to the given partition can split or merge with.
+        """
+        partition_indices = { partition_index-1, partition_index, partition_index+1 }
+        for pair in partition.get_all_vertical_merges(self.net, partition_index):
+            partition_indices.update(pair)
+        return sorted([ i for i in partition_indices if 0 <= i < len(self.net.partitions) ])
+
+    @profiled("update_partitions")
+    def update_partitions(self):
+        """
+        incremental version of `Network.update_partitions`, which only updates
+        the partitions that the transforms have flagged as dirty. Partitions
+        without the flag are always updated.
+        """
+        # remove all empty partitions
+        if any([ len(p.graph.nodes) == 0 for p in self.net.partitions ]):
+            self.net.partitions = [ p for p in self.net.partitions \
+                    if len(p.graph.nodes) > 0 ]
+        # update the dirty partitions only
+        for p in self.net.partitions:
+            if not getattr(p, "dirty", True):
+                continue
+            ## remove auxiliary layers
+            with self.profiler.phase("remove_squeeze"):
+                p.remove_squeeze()
+            ## update batch size for partitions
+            p.batch_size = self.net.batch_size
+            ## update the partition
+            p.update()
+            p.dirty = False
+
     def solver_status(self):
         """
         prints out the current status of the solver.
@@ -165,8 +314,9 @@ class Solver:
         objective  = objectives[self.objective]
         # cost
         cost = self.get_cost()
+        self.profiler.record_cost(cost)
         # Resources
-        resources = [ partition.get_resource_usage() for partition in self.net.partitions ]
+        resources = [ partition_resource_usage(partition) for partition in self.net.partitions ]
         BRAM = max([ resource['BRAM'] for resource in resources ])
         DSP  = max([ resource['DSP']  for resource in resources ])
         LUT  = max([ resource['LUT']  for resource in resources ])
@@ -179,19 +329,125 @@ class Solver:
             print("COST:\t {cost} ({objective}), RESOURCE:\t {BRAM}\t{DSP}\t{LUT}\t{FF}\t(BRAM|DSP|LUT|FF)".format(
                 cost=cost,objective=objective,BRAM=int(BRAM),DSP=int(DSP),LUT=int(LUT),FF=int(FF)), end='\n')
 
+    def get_solver_state(self):
+        """
+        returns the parameters of the solver that can be stored in a
+        checkpoint, such as the annealing temperature
+        """
+        state = {}
+        for solver_field in dataclasses.fields(self):
+            if solver_field.name in [ "net", "undo_log", "checkpoint_path", "checkpoints_kept",
+                    "profiler", "deadline", "best_cost", "best_design" ]:
+                continue
+            val = serialise(getattr(self, solver_field.name))
+            if val is not UNSERIALISABLE:
+                state[solver_field.name] = val
+        return state
+
+    def set_solver_state(self, state):
+        """
+        restores the parameters of the solver from `get_solver_state`
+        """
+        for key, val in state.items():
+            setattr(self, key, copy.deepcopy(val))
+
+    def get_partitions_state(self):
+        """
+        returns the design of the network as plain values, which can be
+        stored in a checkpoint or sent to another process. Only the node
+        names and edges of each partition are stored, along with the
+        parameters of the layers and partitions.
+        """
+        # auxiliary layers are left out, as they are recreated on update
+        def is_squeeze(p, node):
+            return p.graph.nodes[node]["type"] == LAYER_TYPE.Squeeze
+        def get_next_layers(p, node):
+            # follow the edges through any squeeze layers
+            for next_node in p.graph.successors(node):
+                if is_squeeze(p, next_node):
+                    yield from get_next_layers(p, next_node)
+                else:
+                    yield next_node
+        # store the partitions
+        return [ {
+            "attributes": get_attribute_state(p, exclude=["graph"]),
+            "nodes": { node: get_attribute_state(p.graph.nodes[node]["hw"]) \
+                    for node in p.graph.nodes if not is_squeeze(p, node) },
+            "edges": [ (node, next_node) for node in p.graph.nodes \
+                    if not is_squeeze(p, node) for next_node in get_next_layers(p, node) ],
+        } for p in self.net.partitions ]
+
+    def set_partitions_state(self, partitions_state):
+        """
+        restores the design of the network from `get_partitions_state`. The
+        partitions are rebuilt from the layers of the current network.
+        """
+        # get all the layers of the network
+        for p in self.net.partitions:
+            p.remove_squeeze()
+        nodes = { node: data for p in self.net.partitions \
+                for node, data in p.graph.nodes(data=True) }
+        # rebuild the partitions
+        partitions = []
+        for partition_state in partitions_state:
+            # create the graph of the partition
+            graph = nx.DiGraph()
+            for node, layer_state in partition_state["nodes"].items():
+                graph.add_node(node, **copy.deepcopy(nodes[node]))
+                set_layer_state(graph.nodes[node]["hw"], layer_state)
+            graph.add_edges_from([ tuple(edge) for edge in partition_state["edges"] ])
+            p = Partition(graph)
+            # restore the attributes of the partition
+            vars(p).update(copy.deepcopy(partition_state["attributes"]))
+            mark_dirty(p)
+            partitions.append(p)
+        self.net.partitions = partitions
+        # update all partitions
+        self.update_partitions()
+
+    def get_checkpoint(self):
+        """
+        returns a checkpoint of the design decisions of the solver, made of
+        the design of the network, the parameters of the solver and the
+        state of the random number generators.
+        """
+        return {
+            "solver": self.get_solver_state(),
+            "rng": get_rng_state(),
+            "partitions": self.get_partitions_state(),
+        }
+
+    def load_checkpoint(self, checkpoint):
+        """
+        restores the solver from a checkpoint created with `get_checkpoint`
+        """
+        # restore the solver parameters and random number generators
+        self.set_solver_state(checkpoint["solver"])
+        set_rng_state(checkpoint["rng"])
+        # restore the design
+        self.set_partitions_state(checkpoint["partitions"])
+
+    def save_checkpoint(self):
+        """
+        writes a checkpoint to `checkpoint_path`, if set, keeping only the
+        last `checkpoints_kept` checkpoints. Returns the checkpoint's path.
+        """
+        if self.checkpoint_path is None:
+            return None
+        return write_checkpoint(self.checkpoint_path, self.get_checkpoint(),
+                keep=self.checkpoints_kept)
+
     def save_design_checkpoint(self, output_path):
-        # pickle the current optimiser state
-        checkpoint = pickle.dumps(self)
+        # get the current optimiser state
+        checkpoint = self.get_checkpoint()
         # save to output path
-        with open(output_path, "wb") as f:
-            f.write(checkpoint)
+        with open(output_path, "w") as f:
+            json.dump(checkpoint, f)
 
     def wandb_checkpoint(self):
-        # pickle optimiser object
-        checkpoint = pickle.dumps(self)
-        checkpoint_path = f"checkpoint/{uuid.uuid4().hex}.dcp"
-        with open(checkpoint_path,"wb") as f:
-            f.write(checkpoint)
+        # save the optimiser state
+        checkpoint_path = write_checkpoint(self.checkpoint_path or "checkpoint",
+                self.get_checkpoint(), keep=self.checkpoints_kept)
         # create a wandb artifact
         artifact_timestamp = datetime.now().strftime("%m-%d-%Y-%H.%M.%S.%f")
         # artifact_name = f"checkpoint-{artifact_timestamp}"
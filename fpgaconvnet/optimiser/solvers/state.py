@@ -0,0 +1,319 @@
+"""
+Lightweight snapshots of the hardware parameters of partitions, used to undo
+moves without copying the whole `Network`, and compact checkpoints of the
+design decisions of a solver, used to resume a run.
+"""
+
+import os
+import re
+import json
+import copy
+import random
+import numbers
+import numpy as np
+
+from fpgaconvnet.optimiser.transforms.helper import mark_dirty
+
+# hardware parameters of a layer that the transforms can change
+NODE_PARAMETERS = [ "channels", "filters", "groups", "coarse", "coarse_in",
+        "coarse_out", "coarse_group", "fine" ]
+
+# attributes of a partition that the transforms can change
+PARTITION_PARAMETERS = [ "graph", "wr_layer", "wr_factor" ]
+
+def get_node_parameters(hw):
+    """
+    returns a copy of the hardware parameters of a layer. The parameters are
+    read from the layer's attributes directly, so that multi-port layers keep
+    their per-port values.
+    """
+    return { key: copy.copy(val) for key, val in vars(hw).items() \
+            if key.lstrip("_") in NODE_PARAMETERS }
+
+def set_node_parameters(hw, params):
+    """
+    restores the hardware parameters of a layer from `get_node_parameters`
+    and updates the layer's modules
+    """
+    vars(hw).update({ key: copy.copy(val) for key, val in params.items() })
+    hw.update()
+
+def get_partition_parameters(partition):
+    """
+    returns a snapshot of the partition's graph reference, weights reloading
+    and the hardware parameters of all of its nodes.
+    """
+    return {
+        "attributes": { attr: getattr(partition, attr) \
+                for attr in PARTITION_PARAMETERS },
+        "nodes": { node: get_node_parameters(partition.graph.nodes[node]["hw"]) \
+                for node in partition.graph.nodes },
+    }
+
+def set_partition_parameters(partition, params):
+    """
+    restores a partition from a snapshot taken with `get_partition_parameters`.
+    Nodes no longer in the graph (i.e. squeeze layers) are skipped, and are
+    recreated the next time the partition is updated.
+    """
+    # restore the graph and weights reloading
+    for attr, val in params["attributes"].items():
+        setattr(partition, attr, val)
+    # restore the hardware parameters of each node
+    for node, node_params in params["nodes"].items():
+        if node in partition.graph:
+            set_node_parameters(partition.graph.nodes[node]["hw"], node_params)
+    # flag the partition as changed
+    mark_dirty(partition)
+
+class UndoLog:
+    """
+    Transactional record of the moves applied to a network. The first time a
+    partition is touched its parameters are recorded, along with the list of
+    partitions if a move changes the partition structure. Rolling back
+    replays these records backwards, so rejecting a move costs the size of
+    the change rather than the size of the network.
+    """
+
+    def __init__(self):
+        # partition list prior to any structural edits
+        self.partitions = None
+        # snapshots of touched partitions, keyed by the partition's id
+        self.entries = {}
+
+    def record_partition(self, partition):
+        """
+        record the state of a partition, if not already recorded
+        """
+        if id(partition) not in self.entries:
+            self.entries[id(partition)] = (partition,
+                    get_partition_parameters(partition))
+
+    def record_partition_list(self, net):
+        """
+        record the list of partitions, if not already recorded
+        """
+        if self.partitions is None:
+            self.partitions = list(net.partitions)
+
+    def rollback(self, net):
+        """
+        undo all recorded moves, restoring the network to the state it was
+        in when recording started
+        """
+        # restore the partition structure
+        if self.partitions is not None:
+            net.partitions = self.partitions
+        # restore the parameters of the touched partitions
+        for partition, params in reversed(list(self.entries.values())):
+            set_partition_parameters(partition, params)
+        # start a new transaction
+        self.clear()
+
+    def clear(self):
+        """
+        discard all records, committing the recorded moves
+        """
+        self.partitions = None
+        self.entries = {}
+
+class BlockJournal:
+    """
+    Copy-on-write record of the moves applied to a dictionary of building
+    blocks. The first time a move changes a block, the block is replaced by
+    a copy and the original is kept, along with the dictionary itself if a
+    move adds or removes blocks. Rolling back swaps the originals back in,
+    so a move only copies the blocks it changes.
+    """
+
+    def __init__(self):
+        # building blocks prior to any structural edits
+        self.blocks = None
+        # original blocks, keyed by the block's name
+        self.entries = {}
+
+    def record_block(self, blocks, key):
+        """
+        replace a block with a copy that can be changed, keeping the
+        original, if not already recorded
+        """
+        if key in self.entries or key not in blocks:
+            return
+        # blocks added by the recorded moves are discarded on rollback
+        if self.blocks is not None and self.blocks.get(key) is not blocks[key]:
+            return
+        self.entries[key] = blocks[key]
+        blocks[key] = copy.deepcopy(blocks[key])
+
+    def record_blocks(self, blocks):
+        """
+        record the blocks in the dictionary, if not already recorded
+        """
+        if self.blocks is None:
+            self.blocks = dict(blocks)
+
+    def rollback(self, blocks):
+        """
+        undo all recorded moves, returning the building blocks as they were
+        when recording started
+        """
+        # restore the blocks that were added or removed
+        if self.blocks is not None:
+            blocks = self.blocks
+        # swap the original blocks back in
+        blocks.update(self.entries)
+        # start a new transaction
+        self.clear()
+        return blocks
+
+    def clear(self):
+        """
+        discard all records, committing the recorded moves
+        """
+        self.blocks = None
+        self.entries = {}
+
+def get_network_snapshot(net):
+    """
+    returns a snapshot of the partition structure of a network and the
+    parameters of every partition, without copying the layers themselves
+    """
+    return {
+        "partitions": list(net.partitions),
+        "parameters": [ get_partition_parameters(p) for p in net.partitions ],
+    }
+
+def set_network_snapshot(net, snapshot):
+    """
+    restores a network from a snapshot taken with `get_network_snapshot`
+    """
+    net.partitions = list(snapshot["partitions"])
+    for partition, params in zip(net.partitions, snapshot["parameters"]):
+        set_partition_parameters(partition, params)
+
+def get_partition_snapshot(partition):
+    """
+    returns a snapshot of a single partition, with its own copy of the graph
+    structure (including any squeeze layers) and the attributes of the
+    partition and of each of its layers, such as the folding factors,
+    weights reloading, squeeze fan-out and URAM flags. The layer objects
+    themselves are shared rather than copied.
+    """
+    return {
+        "graph": partition.graph.copy(),
+        "attributes": get_attribute_state(partition, exclude=["graph"]),
+        "nodes": { node: get_attribute_state(partition.graph.nodes[node]["hw"]) \
+                for node in partition.graph.nodes },
+    }
+
+def set_partition_snapshot(partition, snapshot):
+    """
+    restores a partition from a snapshot taken with `get_partition_snapshot`.
+    The snapshot is left unchanged, so it can be restored again.
+    """
+    partition.graph = snapshot["graph"].copy()
+    vars(partition).update(copy.deepcopy(snapshot["attributes"]))
+    for node, state in snapshot["nodes"].items():
+        set_layer_state(partition.graph.nodes[node]["hw"], state)
+    partition.update()
+
+# marker for attributes that can't be stored in a checkpoint
+UNSERIALISABLE = object()
+
+def serialise(val):
+    """
+    converts a parameter into a JSON value. Returns `UNSERIALISABLE` for
+    objects such as modules, which are derived from the other parameters.
+    """
+    if val is None or isinstance(val, (bool, str)):
+        return val
+    if isinstance(val, numbers.Integral):
+        return int(val)
+    if isinstance(val, numbers.Real):
+        return float(val)
+    if isinstance(val, (list, tuple)):
+        vals = [ serialise(v) for v in val ]
+        return UNSERIALISABLE if any(v is UNSERIALISABLE for v in vals) else vals
+    return UNSERIALISABLE
+
+def get_attribute_state(obj, exclude=[]):
+    """
+    returns all attributes of an object that can be stored in a checkpoint
+    """
+    state = {}
+    for attr, val in vars(obj).items():
+        if attr in exclude:
+            continue
+        val = serialise(val)
+        if val is not UNSERIALISABLE:
+            state[attr] = val
+    return state
+
+def set_layer_state(hw, state):
+    """
+    restores the attributes of a layer from `get_attribute_state` and updates
+    the layer's modules
+    """
+    vars(hw).update(copy.deepcopy(state))
+    hw.update()
+
+def get_rng_state():
+    """
+    returns the state of the python and numpy random number generators
+    """
+    np_state = np.random.get_state()
+    return {
+        "random": random.getstate(),
+        "numpy": [ np_state[0], np_state[1].tolist(), *np_state[2:] ],
+    }
+
+def set_rng_state(state):
+    """
+    restores the random number generators from `get_rng_state`
+    """
+    version, internal_state, gauss_next = state["random"]
+    random.setstate((version, tuple(internal_state), gauss_next))
+    name, keys, *np_state = state["numpy"]
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), *np_state))
+
+def write_checkpoint(checkpoint_path, checkpoint, keep=5):
+    """
+    writes a checkpoint to the checkpoint directory, numbered after the
+    previous one, and removes all but the last `keep` checkpoints. The
+    directory is created if it does not exist. Returns the path of the new
+    checkpoint.
+    """
+    assert keep > 0, "at least one checkpoint must be kept"
+    # find the existing checkpoints
+    os.makedirs(checkpoint_path, exist_ok=True)
+    checkpoints = list_checkpoints(checkpoint_path)
+    index = int(re.findall(r"\d+", checkpoints[-1])[-1])+1 if checkpoints else 0
+    # write the new checkpoint
+    path = os.path.join(checkpoint_path, f"checkpoint-{index:06d}.json")
+    with open(path, "w") as f:
+        json.dump(checkpoint, f)
+    # remove the oldest checkpoints
+    checkpoints.append(path)
+    for old_path in checkpoints[:len(checkpoints)-keep]:
+        os.remove(old_path)
+    return path
+
+def list_checkpoints(checkpoint_path):
+    """
+    returns the checkpoints in a directory, from oldest to newest
+    """
+    return sorted( os.path.join(checkpoint_path, filename) \
+            for filename in os.listdir(checkpoint_path) \
+            if re.fullmatch(r"checkpoint-\d+\.json", filename) )
+
+def read_checkpoint(path):
+    """
+    reads a checkpoint. If `path` is a directory, the newest checkpoint in it
+    is read.
+    """
+    if os.path.isdir(path):
+        checkpoints = list_checkpoints(path)
+        assert checkpoints, f"no checkpoints found in {path}"
+        path = checkpoints[-1]
+    with open(path, "r") as f:
+        return json.load(f)
@@ -8,6 +8,7 @@ from google.protobuf import json_format
 
 import fpgaconvnet.proto.fpgaconvnet_pb2 as fpgaconvnet_pb2
 import fpgaconvnet.tools.graphs as graphs
+from fpgaconvnet.optimiser.transforms.helper import get_ordered_nodes, get_next_nodes
 
 from fpgaconvnet.tools.layer_enum import LAYER_TYPE, from_proto_layer_type
 
@@ -64,7 +65,7 @@ def starting_point_distillation(self, teacher_partition_path, load_wr):
 
     def _iterate_current_student_partition_until_conv(partition, input_node, padded_channels):
         while partition.graph.out_degree(input_node) != 0:
-            input_node = graphs.get_next_nodes(partition.graph,input_node)[0]
+            input_node = get_next_nodes(partition.graph,input_node)[0]
             print("padding channels of ", input_node, partition.graph.nodes[input_node]["hw"].channels, "-->")
             print(padded_channels)
             if partition.graph.nodes[input_node]["type"] == LAYER_TYPE.Convolution \
@@ -90,7 +91,7 @@ def starting_point_distillation(self, teacher_partition_path, load_wr):
             return True
 
         while partition.graph.out_degree(input_node) != 0:
-            input_node = graphs.get_next_nodes(partition.graph,input_node)[0]
+            input_node = get_next_nodes(partition.graph,input_node)[0]
             print("padding channels of ", input_node, partition.graph.nodes[input_node]["hw"].channels, "-->")
             print(padded_channels)
             if partition.graph.nodes[input_node]["type"] == LAYER_TYPE.Convolution \
@@ -139,7 +140,7 @@ def starting_point_distillation(self, teacher_partition_path, load_wr):
             if from_proto_layer_type(layer.type) == LAYER_TYPE.Squeeze:
                 continue
 
-            node = graphs.ordered_node_list(student_partition.graph)[student_node_index]
+            node = get_ordered_nodes(student_partition.graph)[student_node_index]
             student_node_index += 1
             #node = layer.name
             teacher_parameters = json_format.MessageToDict(layer.parameters, preserving_proto_field_name=True)
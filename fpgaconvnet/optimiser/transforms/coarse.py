@@ -10,14 +10,19 @@ Input and output channel dimension parallelism of Layers. For a convolution node
 """
 
 import random
+import bisect
 import numpy as np
 from collections.abc import Iterable
 import fpgaconvnet.tools.graphs as graphs
 from fpgaconvnet.tools.layer_enum import LAYER_TYPE
+from fpgaconvnet.optimiser.transforms.helper import mark_dirty, get_ordered_nodes
+from fpgaconvnet.optimiser.cache import model_cache, layer_latency
 
 transformable_nodes = [ LAYER_TYPE.Convolution, LAYER_TYPE.InnerProduct ]
 
 def apply_random_coarse_node(partition, node):
+    # flag the partition as changed
+    mark_dirty(partition)
     # choose coarse in or coarse out
     coarse_type = random.choice(['coarse_in','coarse_group','coarse_out'])
     # apply coarse folding
@@ -55,6 +60,8 @@ def apply_max_coarse(partition):
         partition.apply_max_coarse_node(partition_index, node)
 
 def apply_max_coarse_node(partition, node):
+    # flag the partition as changed
+    mark_dirty(partition)
     # choose max coarse in and out
     coarse_in  = partition.graph.nodes[node]['hw'].get_coarse_in_feasible()[-1]
     coarse_out = partition.graph.nodes[node]['hw'].get_coarse_out_feasible()[-1]
@@ -67,6 +74,8 @@ def apply_max_coarse_node(partition, node):
         partition.graph.nodes[node]['hw'].coarse_group = coarse_group
 
 def fix_coarse(partition):
+    # flag the partition as changed
+    mark_dirty(partition)
     # iterate over nodes
     for node in partition.graph.nodes():
         # check if coarse in is greater than max feasible coarse in
@@ -92,14 +101,52 @@ def fix_coarse(partition):
             if coarse_group > coarse_group_max:
                 partition.graph.nodes[node]['hw'].coarse_group = coarse_group_max
 
+def get_coarse_ladder(hw, layer_type, coarse_in_first):
+    """
+    returns all the feasible `(coarse_group, coarse_in, coarse_out, product)`
+    combinations of a layer, sorted by increasing product, and then by the
+    order in which `apply_more_coarse` prefers the coarse factors, along
+    with the list of their products to bisect. The feasible coarse factors
+    only depend on the channels of the layer, so the ladder is cached until
+    they change (such as by weights reloading).
+    """
+    def build():
+        coarse_in_feasible = hw.get_coarse_in_feasible()
+        coarse_out_feasible = hw.get_coarse_out_feasible()
+        if layer_type == LAYER_TYPE.Convolution and hw.groups != 1:
+            coarse_group_feasible = hw.get_coarse_group_feasible()
+        else:
+            coarse_group_feasible = [1]
+        # get all the combinations of coarse factors
+        if layer_type in transformable_nodes:
+            ladder = [ (coarse_group, coarse_in, coarse_out, coarse_group*coarse_in*coarse_out) \
+                    for coarse_group in coarse_group_feasible \
+                    for coarse_in in coarse_in_feasible \
+                    for coarse_out in coarse_out_feasible ]
+        else:
+            ladder = [ (coarse_group, coarse_in, coarse_in, coarse_group*coarse_in*coarse_in) \
+                    for coarse_group in coarse_group_feasible \
+                    for coarse_in in coarse_in_feasible ]
+        # sort by product, then by the favoured coarse factor
+        if coarse_in_first:
+            ladder = sorted(ladder, key=lambda x: (x[3],x[2],x[1],x[0]))
+        else:
+            ladder = sorted(ladder, key=lambda x: (x[3],x[1],x[2],x[0]))
+        return ladder, [ x[3] for x in ladder ]
+    key = (type(hw).__name__, layer_type, hw.channels_in(), hw.channels_out(),
+            getattr(hw, "groups", 1), coarse_in_first)
+    return model_cache.lookup("coarse_ladder", key, build)
+
 def apply_more_coarse(partition, reject_list, skip_second_slowest_node, coarse_in_first, fix_coarse):
     partition.remove_squeeze()
+    mark_dirty(partition)
 
-    node_latencys = np.array([ partition.graph.nodes[layer]['hw'].latency() \
-    for layer in graphs.ordered_node_list(partition.graph) ])
+    layers = get_ordered_nodes(partition.graph)
+    node_latencys = np.array([ layer_latency(partition.graph.nodes[layer]['hw']) \
+    for layer in layers ])
 
     for node_index in reversed(np.argsort(node_latencys)):
-        layer = graphs.ordered_node_list(partition.graph)[node_index]
+        layer = layers[node_index]
         
         if layer in reject_list:
             continue
@@ -119,62 +166,38 @@ def apply_more_coarse(partition, reject_list, skip_second_slowest_node, coarse_i
 
         current_coarse_product = current_coarse_in * current_coarse_out * current_coarse_group
 
-        coarse_in_feasible = partition.graph.nodes[layer]['hw'].get_coarse_in_feasible()
-        coarse_out_feasible = partition.graph.nodes[layer]['hw'].get_coarse_out_feasible()                 
-        if partition.graph.nodes[layer]['type'] == LAYER_TYPE.Convolution and partition.graph.nodes[layer]["hw"].groups != 1:
-            coarse_group_feasible = partition.graph.nodes[layer]['hw'].get_coarse_group_feasible()
-        else:
-            coarse_group_feasible = [1]
-
-
-        all_coarse_combination = []
-        if partition.graph.nodes[layer]['type'] in transformable_nodes:
-            for coarse_group in coarse_group_feasible:
-                for coarse_in in coarse_in_feasible:
-                    for coarse_out in coarse_out_feasible:
-                        if fix_coarse:
-                            if coarse_in_first:
-                                if coarse_group*coarse_in*coarse_out > current_coarse_product \
-                                and coarse_group >= current_coarse_group \
-                                and coarse_in >= current_coarse_in \
-                                and coarse_out == current_coarse_out:
-                                    all_coarse_combination.append((coarse_group,coarse_in,coarse_out,coarse_group*coarse_in*coarse_out))
-                            else:
-                                if coarse_group*coarse_in*coarse_out > current_coarse_product \
-                                and coarse_group >= current_coarse_group \
-                                and coarse_in == current_coarse_in \
-                                and coarse_out >= current_coarse_out:
-                                    all_coarse_combination.append((coarse_group,coarse_in,coarse_out,coarse_group*coarse_in*coarse_out))
-                        else:
-                            if coarse_group*coarse_in*coarse_out > current_coarse_product:
-                                all_coarse_combination.append((coarse_group,coarse_in,coarse_out,coarse_group*coarse_in*coarse_out))
-        
-        else:
-            for coarse_group in coarse_group_feasible:
-                for coarse_in in coarse_in_feasible:
-                    coarse_out = coarse_in
-                    if coarse_group*coarse_in*coarse_out > current_coarse_product \
-                    and coarse_group >= current_coarse_group \
-                    and coarse_in >= current_coarse_in:
-                        all_coarse_combination.append((coarse_group,coarse_in,coarse_out,coarse_group*coarse_in*coarse_out))
-
-        
-        if len(all_coarse_combination) > 0:
-            all_coarse_combination = sorted(all_coarse_combination, key=lambda x: (x[3]))
-            next_coarse_product = all_coarse_combination[0][3]
-            all_coarse_combination = list(filter(lambda x: x[3]==next_coarse_product, all_coarse_combination))
-            if coarse_in_first:
-                all_coarse_combination = sorted(all_coarse_combination, key=lambda x: (x[2],x[1],x[0]))
+        # climb the ladder to the next larger parallelism allowed
+        ladder, products = get_coarse_ladder(partition.graph.nodes[layer]['hw'],
+                partition.graph.nodes[layer]['type'], coarse_in_first)
+        selected_coarse_combination = None
+        for coarse_group, coarse_in, coarse_out, coarse_product in \
+                ladder[bisect.bisect_right(products, current_coarse_product):]:
+            if partition.graph.nodes[layer]['type'] in transformable_nodes:
+                if fix_coarse:
+                    if coarse_in_first:
+                        if coarse_group < current_coarse_group \
+                        or coarse_in < current_coarse_in \
+                        or coarse_out != current_coarse_out:
+                            continue
+                    else:
+                        if coarse_group < current_coarse_group \
+                        or coarse_in != current_coarse_in \
+                        or coarse_out < current_coarse_out:
+                            continue
             else:
-                all_coarse_combination = sorted(all_coarse_combination, key=lambda x: (x[1],x[2],x[0]))
-            selected_coarse_combination = all_coarse_combination[0]
-            
+                if coarse_group < current_coarse_group \
+                or coarse_in < current_coarse_in:
+                    continue
+            selected_coarse_combination = (coarse_group, coarse_in, coarse_out, coarse_product)
+            break
+
+        if selected_coarse_combination is not None:
             if partition.graph.nodes[layer]['type'] == LAYER_TYPE.Convolution:
                 partition.graph.nodes[layer]['hw'].coarse_group = int(selected_coarse_combination[0])
             partition.graph.nodes[layer]['hw'].coarse_in = int(selected_coarse_combination[1])
             partition.graph.nodes[layer]['hw'].coarse_out = int(selected_coarse_combination[2])
             partition.graph.nodes[layer]['hw'].update()
-            if partition.graph.nodes[layer]['hw'].latency() < node_latencys[node_index]:
+            if layer_latency(partition.graph.nodes[layer]['hw']) < node_latencys[node_index]:
                 return True, layer
             else:
                 partition.graph.nodes[layer]['hw'].coarse_in = current_coarse_in
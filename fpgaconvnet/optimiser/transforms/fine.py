@@ -7,7 +7,7 @@ Defines the parallelism for the kernel x kernel dot product of the `fpgaconvnet_
 
 import random
 import numpy as np
-from fpgaconvnet.optimiser.transforms.helper import get_all_layers
+from fpgaconvnet.optimiser.transforms.helper import get_all_layers, mark_dirty
 from fpgaconvnet.tools.layer_enum import LAYER_TYPE
 
 def apply_random_fine_node(partition, node):
@@ -22,8 +22,12 @@ def apply_random_fine_node(partition, node):
         fine = random.choice(partition.graph.nodes[node]['hw'].get_fine_feasible())
         # update modules fine grain folding factor
         partition.graph.nodes[node]['hw'].fine = fine
+        # flag the partition as changed
+        mark_dirty(partition)
 
 def apply_complete_fine(partition):
+    # flag the partition as changed
+    mark_dirty(partition)
     # iterate over nodes node info
     for node in partition.graph.nodes():
         # choose to apply to convolution node only
@@ -49,6 +53,7 @@ def apply_more_fine(partition, reject_list=[], skip_second_slowest_node=False):
                 fine_index = fine_feasible.index(current_fine) + 1
                 partition.graph.nodes[layer]['hw'].fine = fine_feasible[fine_index]
                 partition.graph.nodes[layer]['hw'].update()
+                mark_dirty(partition)
                 if partition.graph.nodes[layer]['hw'].latency() < node_latencys[node_index]:
                     return True, layer
                 else:
@@ -2,10 +2,100 @@
 A set of helper functions for the various transforms.
 """
 
+import weakref
 from functools import reduce
 
+import fpgaconvnet.tools.graphs as graphs
 from fpgaconvnet.tools.layer_enum import LAYER_TYPE
 
+# cached structures of each graph, keyed by the graph object
+graph_cache = weakref.WeakKeyDictionary()
+
+# number of structures cached per graph, such as with and without squeeze layers
+GRAPH_CACHE_SIZE = 4
+
+def get_graph_info(graph):
+    """
+    returns the cached structure of a graph: its topological order, its
+    nodes by layer type and the successors of each node. The cache is keyed
+    on the graph's nodes, as squeeze layers are added and removed in place,
+    and the structures of the last few sets of nodes are kept. Transforms
+    that otherwise change the structure of a graph call `invalidate_graph`.
+
+    Parameters
+    ----------
+    graph: networkx.DiGraph
+        graph of a partition
+
+    Returns
+    -------
+    dict
+        the `order`, `types` and `successors` of the graph
+    """
+    signature = (tuple(graph.nodes()), graph.number_of_edges())
+    structures = graph_cache.setdefault(graph, {})
+    info = structures.get(signature)
+    if info is None:
+        types = {}
+        for node in graph.nodes():
+            types.setdefault(graph.nodes[node]['type'], []).append(node)
+        info = {
+            "order": tuple(graphs.ordered_node_list(graph)),
+            "types": types,
+            "successors": { node: list(graph.successors(node)) for node in graph.nodes() },
+        }
+        # keep only the most recent structures
+        structures[signature] = info
+        if len(structures) > GRAPH_CACHE_SIZE:
+            del structures[next(iter(structures))]
+    return info
+
+def invalidate_graph(graph):
+    """
+    discards the cached structure of a graph
+
+    Parameters
+    ----------
+    graph: networkx.DiGraph
+        graph of a partition
+    """
+    graph_cache.pop(graph, None)
+
+def get_ordered_nodes(graph):
+    """
+    cached `graphs.ordered_node_list`
+
+    Parameters
+    ----------
+    graph: networkx.DiGraph
+        graph of a partition
+
+    Returns
+    -------
+    tuple
+        nodes of the graph in topological order
+    """
+    return get_graph_info(graph)["order"]
+
+def get_next_nodes(graph, node):
+    """
+    cached `graphs.get_next_nodes`
+
+    Parameters
+    ----------
+    graph: networkx.DiGraph
+        graph of a partition
+
+    node: str
+        node of the graph
+
+    Returns
+    -------
+    list
+        successors of the node
+    """
+    return list(get_graph_info(graph)["successors"][node])
+
 def get_all_layers(graph, layer_type):
     """
     Parameters
@@ -23,11 +113,20 @@ def get_all_layers(graph, layer_type):
         A list of layers within the graph with the
         specified layer type
     """
-    layers= []
-    for node in graph.nodes():
-        if graph.nodes[node]['type'] == layer_type:
-            layers.append(node)
-    return layers
+    return list(get_graph_info(graph)["types"].get(layer_type, []))
+
+def mark_dirty(partition):
+    """
+    flags that the partition has changed since it was last updated, so that
+    incremental updates of the network only update the partitions that were
+    changed.
+
+    Parameters
+    ----------
+    partition: fpgaconvnet.models.partition.Partition
+        partition changed by a transform
+    """
+    partition.dirty = True
 
 def get_factors(n):
     """
@@ -11,7 +11,8 @@ import fpgaconvnet.tools.graphs as graphs
 import fpgaconvnet.tools.matrix as matrix
 from fpgaconvnet.tools.layer_enum import LAYER_TYPE, from_onnx_op_type
 
-from fpgaconvnet.optimiser.transforms.helper import get_all_layers
+from fpgaconvnet.optimiser.transforms.helper import get_all_layers, mark_dirty, get_next_nodes, \
+        invalidate_graph, get_graph_info, get_ordered_nodes
 import fpgaconvnet.optimiser.transforms.weights_reloading as weights_reloading
 
 def check_parallel_block(net, partition_index):
@@ -43,36 +44,49 @@ def check_config_allowed_partitions(allowed_partitions, node0_type, node1_type):
         return True
 
 def get_all_horizontal_splits(net, partition_index, allowed_partitions=None):
-    # function to iterate over graph
-    def _iterate_graph(edge_list,input_node,in_parallel_block):
-        # check if end
-        if net.partitions[partition_index].graph.out_degree(input_node) == 0:
-            return edge_list
+    """
+    returns all the edges that a partition can be split at horizontally, in
+    order. The graph is walked iteratively from its input node in a single
+    pass, and the edges are cached with the structure of the graph, as the
+    solvers query the same partitions repeatedly.
+    """
+    graph = net.partitions[partition_index].graph
+    # get the cached splits of the graph
+    if allowed_partitions is None:
+        key = None
+    else:
+        key = tuple( tuple(allowed_split) for allowed_split in allowed_partitions )
+    horizontal_splits = get_graph_info(graph).setdefault("horizontal_splits", {})
+    if key in horizontal_splits:
+        return list(horizontal_splits[key])
+    # iterate over graph from start node
+    edge_list = []
+    in_parallel_block = False
+    input_node  = graphs.get_input_nodes(graph)[0] # TODO: assuming only one input
+    output_node = graphs.get_output_nodes(graph)[0]
+    while graph.out_degree(input_node) > 0:
         # next node
-        next_node = graphs.get_next_nodes(net.partitions[partition_index].graph,input_node)[0]
+        next_nodes = get_next_nodes(graph,input_node)
+        next_node = next_nodes[0]
         # check if exiting parallel block
-        if net.partitions[partition_index].graph.in_degree(input_node) > 1:
+        if graph.in_degree(input_node) > 1:
             in_parallel_block = False
         # check if entering parallel block
-        if net.partitions[partition_index].graph.out_degree(input_node) > 1:
-            output_node = graphs.get_output_nodes(net.partitions[partition_index].graph)[0]
-            if graphs.get_next_nodes(net.partitions[partition_index].graph,input_node)[1] != output_node:
-                return _iterate_graph(edge_list,next_node,True)
+        if graph.out_degree(input_node) > 1 and next_nodes[1] != output_node:
+            in_parallel_block = True
         # skip node - concat partition
-        if net.partitions[partition_index].graph.in_degree(next_node) > 1:
-            return _iterate_graph(edge_list,next_node,in_parallel_block)
+        elif graph.in_degree(next_node) > 1:
+            pass
         # skip node - split position not valid
-        if not check_config_allowed_partitions(allowed_partitions, 
-            net.partitions[partition_index].graph.nodes[input_node]["type"],
-            net.partitions[partition_index].graph.nodes[next_node]["type"]):
-            return _iterate_graph(edge_list,next_node,in_parallel_block) 
+        elif not check_config_allowed_partitions(allowed_partitions,
+                graph.nodes[input_node]["type"], graph.nodes[next_node]["type"]):
+            pass
         # append to partition list
-        if not in_parallel_block:
+        elif not in_parallel_block:
             edge_list.append((input_node,next_node))
-        return _iterate_graph(edge_list,next_node,in_parallel_block)
-    # iterate over graph from start node
-    input_node = graphs.get_input_nodes(net.partitions[partition_index].graph)[0]
-    return _iterate_graph([],input_node,False) # TODO: assuming only one input
+        input_node = next_node
+    horizontal_splits[key] = tuple(edge_list)
+    return edge_list
 
 def get_all_vertical_splits(net, partition_index): # TODO: improve to get all possible combinations
     # check if parallel block
@@ -80,7 +94,7 @@ def get_all_vertical_splits(net, partition_index): # TODO: improve to get all po
         return None
     vertical_splits = []
     input_node = graphs.get_input_nodes(net.partitions[partition_index].graph)[0]
-    split_nodes = graphs.get_next_nodes(net.partitions[partition_index].graph,input_node)
+    split_nodes = get_next_nodes(net.partitions[partition_index].graph,input_node)
     subsets = [v for a in range(len(split_nodes)) for v in combinations(split_nodes, a)]
     for i in range(1,math.ceil(len(subsets)/2)):
         vertical_splits.append([list(chain(subsets[i])), [e for e in split_nodes if e not in subsets[i]]])
@@ -93,7 +107,7 @@ def get_all_horizontal_merges(net, partition_index):
     output_node = graphs.get_output_nodes(net.partitions[partition_index].graph)[0]
     def _find_next_partition():
         if net.graph.out_degree(output_node) > 0:
-            next_node = graphs.get_next_nodes(net.graph,output_node)[0]
+            next_node = get_next_nodes(net.graph,output_node)[0]
             # find the partition pair for the output
             for i in range(len(net.partitions)):
                 if next_node in graphs.get_input_nodes(net.partitions[i].graph):
@@ -146,33 +160,109 @@ def get_all_vertical_merges(net, partition_index):
             partition_pairs.append((i,partition_index))
     return partition_pairs
 
+def mark_neighbourhood_dirty(net, partition_index):
+    # flag the partition and its neighbours as changed
+    for i in range(partition_index-1, partition_index+2):
+        if 0 <= i < len(net.partitions):
+            mark_dirty(net.partitions[i])
+
+def insert_split_partition(net, partition_index, partition_graphs):
+    """
+    replaces a partition with the pieces of its split graph. Rather than
+    deep-copying the partition, each piece but the last gets a shallow copy
+    of it, with its own copies of any mutable attributes, and the last piece
+    keeps the original. The split graphs already have their own node
+    attributes, so only the layers in several pieces (i.e. the split layer
+    of a vertical split) are copied, as weights reloading changes each
+    piece's layers independently.
+    """
+    partition = net.partitions[partition_index]
+    # copy the layers shared with the later pieces
+    seen = set(partition_graphs[-1].nodes)
+    for graph in reversed(partition_graphs[:-1]):
+        for node in graph.nodes:
+            if node in seen:
+                graph.nodes[node]['hw'] = copy.deepcopy(graph.nodes[node]['hw'])
+        seen.update(graph.nodes)
+    # create the new partitions from the original's attributes
+    new_partitions = []
+    for graph in partition_graphs[:-1]:
+        new_partition = copy.copy(partition)
+        vars(new_partition).update({ key: copy.copy(val) for key, val \
+                in vars(partition).items() if isinstance(val, (list, dict, set)) })
+        new_partition.graph = graph
+        new_partitions.append(new_partition)
+    partition.graph = partition_graphs[-1]
+    net.partitions[partition_index:partition_index] = new_partitions
+
 def split_horizontal(net, partition_index, edge):
+    # discard the cached structure of the graph
+    invalidate_graph(net.partitions[partition_index].graph)
     # remove weights reloading transform
     weights_reloading.remove_weights_reloading_transform(net.partitions[partition_index])
-    # create a new partition
-    net.partitions.insert(partition_index,copy.deepcopy(net.partitions[partition_index]))
     # split graph
     partition_graphs = graphs.split_graph_horizontal(net.partitions[partition_index].graph,edge)
-    net.partitions[partition_index].graph   = partition_graphs[0]
-    net.partitions[partition_index+1].graph = partition_graphs[1]
+    # create a new partition, sharing the layers of the original
+    insert_split_partition(net, partition_index, partition_graphs)
     # apply max weights reloading to both
     weights_reloading.apply_max_weights_reloading(net.partitions[partition_index])
     weights_reloading.apply_max_weights_reloading(net.partitions[partition_index+1])
+    # flag the new partitions and their neighbours as changed
+    mark_neighbourhood_dirty(net, partition_index)
+    mark_neighbourhood_dirty(net, partition_index+1)
+
+def split_horizontal_all(net, partition_index, edges):
+    """
+    splits a partition at all of the given edges at once, rather than one
+    edge at a time, which would copy the rest of the graph for every split.
+    Nodes are assigned to pieces in topological order, moving to the next
+    piece across each of the edges.
+    """
+    # discard the cached structure of the graph
+    graph = net.partitions[partition_index].graph
+    invalidate_graph(graph)
+    # remove weights reloading transform
+    weights_reloading.remove_weights_reloading_transform(net.partitions[partition_index])
+    # assign each node to a piece of the graph
+    edges = set(edges)
+    piece = {}
+    for node in get_ordered_nodes(graph):
+        piece[node] = max([ piece[prev] + int((prev,node) in edges) \
+                for prev in graph.predecessors(node) ], default=0)
+    pieces = [ [] for _ in range(max(piece.values())+1) ]
+    for node, i in piece.items():
+        pieces[i].append(node)
+    # create a partition for each piece, sharing the layers of the original
+    insert_split_partition(net, partition_index,
+            [ graph.subgraph(nodes).copy() for nodes in pieces ])
+    # apply max weights reloading to each piece
+    for i in range(partition_index, partition_index+len(pieces)):
+        weights_reloading.apply_max_weights_reloading(net.partitions[i])
+    # flag the new partitions and their neighbours as changed
+    for i in range(partition_index, partition_index+len(pieces)):
+        mark_neighbourhood_dirty(net, i)
+    return len(pieces)
 
 def split_vertical(net, partition_index, nodes):
+    # discard the cached structure of the graph
+    invalidate_graph(net.partitions[partition_index].graph)
     # remove weights reloading transform
     weights_reloading.remove_weights_reloading_transform(net.partitions[partition_index])
-     # create a new partition
-    net.partitions.insert(partition_index,copy.deepcopy(net.partitions[partition_index]))
     # split the graph
     partition_graphs = graphs.split_graph_vertical(net.partitions[partition_index].graph,nodes)
-    net.partitions[partition_index].graph   = partition_graphs[0]
-    net.partitions[partition_index+1].graph = partition_graphs[1]
+    # create a new partition, sharing the layers of the original
+    insert_split_partition(net, partition_index, partition_graphs)
     # apply max weights reloading to both
     weights_reloading.apply_max_weights_reloading(net.partitions[partition_index])
     weights_reloading.apply_max_weights_reloading(net.partitions[partition_index+1])
+    # flag the new partitions and their neighbours as changed
+    mark_neighbourhood_dirty(net, partition_index)
+    mark_neighbourhood_dirty(net, partition_index+1)
 
 def merge_horizontal(net, partition_index_a, partition_index_b):
+    # discard the cached structure of the graphs
+    invalidate_graph(net.partitions[partition_index_a].graph)
+    invalidate_graph(net.partitions[partition_index_b].graph)
     # remove weights reloading transform
     weights_reloading.remove_weights_reloading_transform(net.partitions[partition_index_a])
     weights_reloading.remove_weights_reloading_transform(net.partitions[partition_index_b])
@@ -184,8 +274,14 @@ def merge_horizontal(net, partition_index_a, partition_index_b):
     weights_reloading.apply_max_weights_reloading(net.partitions[partition_index_a])
     # remove last partition
     del net.partitions[partition_index_b]
+    # flag the merged partition and its neighbours as changed
+    mark_neighbourhood_dirty(net, partition_index_a)
+    mark_neighbourhood_dirty(net, min(partition_index_b, len(net.partitions)-1))
 
 def merge_vertical(net, partition_index_a, partition_index_b):
+    # discard the cached structure of the graphs
+    invalidate_graph(net.partitions[partition_index_a].graph)
+    invalidate_graph(net.partitions[partition_index_b].graph)
     # remove weights reloading transform
     weights_reloading.remove_weights_reloading_transform(net.partitions[partition_index_a])
     weights_reloading.remove_weights_reloading_transform(net.partitions[partition_index_b])
@@ -197,22 +293,23 @@ def merge_vertical(net, partition_index_a, partition_index_b):
     weights_reloading.apply_max_weights_reloading(net.partitions[partition_index_a])
     # remove last partition
     del net.partitions[partition_index_b]
+    # flag the merged partition and its neighbours as changed
+    mark_neighbourhood_dirty(net, partition_index_a)
+    mark_neighbourhood_dirty(net, min(partition_index_b, len(net.partitions)-1))
 
 def split_horizontal_complete(net, allowed_partitions):
-    # function to find a horizontal split
-    def _find_horizontal_split_partition():
-        for i in range(len(net.partitions)):
-            if get_all_horizontal_splits(net, i, allowed_partitions):
-                return i
-        return None
-    partition_index = _find_horizontal_split_partition()
-    # keep iterating until all horizontal splits done
-    while partition_index != None:
-        # apply first possible split
+    # check each partition once, from the last so that splits don't shift
+    # the partitions still to be checked
+    partition_indices = list(range(len(net.partitions)))
+    while partition_indices:
+        partition_index = partition_indices.pop()
+        # apply all possible splits in one go
         horizontal_splits = get_all_horizontal_splits(net, partition_index, allowed_partitions)
-        split_horizontal(net, partition_index, horizontal_splits[0])
-        # find next partition
-        partition_index = _find_horizontal_split_partition()
+        if not horizontal_splits:
+            continue
+        n_pieces = split_horizontal_all(net, partition_index, horizontal_splits)
+        # check the new partitions, in case splitting enabled more splits
+        partition_indices.extend(range(partition_index, partition_index+n_pieces))
 
 def split_vertical_complete(net):
     def _find_vertical_split_partition():
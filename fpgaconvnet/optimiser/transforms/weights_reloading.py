@@ -48,6 +48,8 @@ def apply_max_weights_reloading(partition):
     apply_weights_reloading_transform(partition)
 
 def remove_weights_reloading_transform(partition):
+    # flag the partition as changed
+    helper.mark_dirty(partition)
     # if there is a wr layer
     if partition.wr_layer:
         # update number of filters in wr layer
@@ -65,6 +67,8 @@ def remove_weights_reloading_transform(partition):
     fix_coarse(partition)
 
 def apply_weights_reloading_transform(partition):
+    # flag the partition as changed
+    helper.mark_dirty(partition)
     # if there is a wr layer
     if partition.wr_layer:
         # update number of filters in wr layer
@@ -0,0 +1,60 @@
+import unittest
+import networkx as nx
+from fpgaconvnet.optimiser.cache import ModelCache, layer_key, partition_key
+
+class Layer:
+
+    def __init__(self, coarse_in, coarse_out):
+        self.coarse_in = coarse_in
+        self.coarse_out = coarse_out
+        self.modules = { "fork": object() }
+
+    def latency(self):
+        return 1000 // (self.coarse_in*self.coarse_out)
+
+class Partition:
+
+    def __init__(self, wr_factor, dirty):
+        self.graph = nx.DiGraph()
+        self.graph.add_node("conv", hw=Layer(2,4))
+        self.wr_factor = wr_factor
+        self.dirty = dirty
+        self.need_optimise = dirty
+
+class TestModelCache(unittest.TestCase):
+
+    def test_layer_key(self):
+        # identical configurations share a key
+        self.assertEqual(layer_key(Layer(2,[4,4])), layer_key(Layer(2,[4,4])))
+        # different configurations don't
+        self.assertNotEqual(layer_key(Layer(2,4)), layer_key(Layer(4,2)))
+
+    def test_partition_key(self):
+        # the dirty flag and other bookkeeping doesn't change the key
+        self.assertEqual(partition_key(Partition(1,True)), partition_key(Partition(1,False)))
+        # hardware parameters do
+        self.assertNotEqual(partition_key(Partition(1,False)), partition_key(Partition(2,False)))
+
+    def test_lookup(self):
+        cache = ModelCache()
+        layer = Layer(2,4)
+        evaluations = []
+        def latency():
+            evaluations.append(layer_key(layer))
+            return layer.latency()
+        for _ in range(3):
+            self.assertEqual(cache.lookup("latency", layer_key(layer), latency), 125)
+        self.assertEqual(len(evaluations), 1)
+        self.assertEqual(cache.hits["latency"], 2)
+        self.assertEqual(cache.misses["latency"], 1)
+
+    def test_eviction(self):
+        cache = ModelCache(maxsize=2)
+        for coarse_in in [1,2,1,4]:
+            layer = Layer(coarse_in,1)
+            cache.lookup("latency", layer_key(layer), layer.latency)
+        # the least recently used configuration is evicted
+        self.assertEqual(len(cache.entries), 2)
+        self.assertNotIn(("latency", layer_key(Layer(2,1))), cache.entries)
+        self.assertIn(("latency", layer_key(Layer(1,1))), cache.entries)
+
@@ -0,0 +1,63 @@
+import unittest
+import dataclasses
+import toml
+
+from fpgaconvnet.optimiser.solvers import SimulatedAnnealing, Improve
+from fpgaconvnet.optimiser.solvers.cooling import reset_schedule, update_temperature, is_stagnated
+
+class Annealer:
+
+    def __init__(self, adaptive_cooling=True, stagnation_window=0):
+        self.T = 10.0
+        self.k = 1.0
+        self.cool = 0.99
+        self.cool_min = 0.9
+        self.adaptive_cooling = adaptive_cooling
+        self.cooling_lambda = 0.7
+        self.cooling_window = 20
+        self.target_acceptance = 0.4
+        self.stagnation_window = stagnation_window
+        reset_schedule(self)
+
+class TestCooling(unittest.TestCase):
+
+    def test_fixed(self):
+        annealer = Annealer(adaptive_cooling=False)
+        for cost in [3, 1, 2]:
+            update_temperature(annealer, cost, True)
+        self.assertAlmostEqual(annealer.T, 10.0*0.99**3)
+
+    def test_adaptive_bounds(self):
+        # a converged cost cools at the fastest rate
+        annealer = Annealer()
+        for _ in range(5):
+            update_temperature(annealer, 1.0, True)
+        self.assertAlmostEqual(annealer.T, 10.0*0.99*0.9**4)
+        # a widely spread cost cools at the slowest rate
+        annealer = Annealer()
+        for cost in [0, 1e6, 0, 1e6, 0]:
+            update_temperature(annealer, cost, True)
+        self.assertAlmostEqual(annealer.T, 10.0*0.99**5)
+
+    def test_stagnation(self):
+        annealer = Annealer(stagnation_window=3)
+        costs = [5, 4, 4, 4, 3, 3, 3, 3]
+        stopped = [ is_stagnated(annealer, cost) for cost in costs ]
+        self.assertEqual(stopped, [False]*7 + [True])
+        # a window of zero never stops
+        annealer = Annealer()
+        self.assertFalse(any(is_stagnated(annealer, 1) for _ in range(100)))
+
+class TestCoolingConfig(unittest.TestCase):
+
+    def test_solver_fields(self):
+        # both solvers share the cooling keys of the annealing section
+        config = toml.load("examples/optimiser_example.toml")["annealing"]
+        for solver in [ SimulatedAnnealing, Improve ]:
+            fields = [ field.name for field in dataclasses.fields(solver) ]
+            for key in config:
+                if key != "transform_iterations":
+                    self.assertIn(key, fields)
+
+if __name__ == "__main__":
+    unittest.main()
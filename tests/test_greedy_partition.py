@@ -0,0 +1,42 @@
+import itertools
+import unittest
+from fpgaconvnet.optimiser.solvers.greedy_partition import get_max_subset_sum, get_min_uram_selection
+
+class TestMaxSubsetSum(unittest.TestCase):
+
+    def test_exhaustive(self):
+        options = [[0, 4, 9], [3, 5], [2, 7, 11], [1, 6]]
+        totals = [ sum(combination) for combination in itertools.product(*options) ]
+        for budget in [7, 13.5, 20, 24, 40]:
+            self.assertEqual(get_max_subset_sum(options, budget),
+                    max([ total for total in totals if total < budget ]))
+
+    def test_budget_is_exclusive(self):
+        self.assertEqual(get_max_subset_sum([[10], [10, 20]], 30), 20)
+        self.assertEqual(get_max_subset_sum([[10], [10, 20]], 30.5), 30)
+
+    def test_many_layers(self):
+        # too many layers to enumerate the cross product
+        options = [[0, 9, 18, 36, 72]]*40
+        self.assertEqual(get_max_subset_sum(options, 1000), 999)
+
+    def test_infeasible(self):
+        self.assertEqual(get_max_subset_sum([[50, 60]], 40), 40)
+
+class TestMinUramSelection(unittest.TestCase):
+
+    def test_selection(self):
+        # the two cheapest layers save enough BRAM, unlike the last layers alone
+        bram_saved = [10, 20, 30, 40]
+        uram_used = [1, 2, 8, 12]
+        self.assertEqual(get_min_uram_selection(bram_saved, uram_used, 30), [0, 1])
+        self.assertEqual(get_min_uram_selection(bram_saved, uram_used, 35), [0, 2])
+
+    def test_nothing_required(self):
+        self.assertEqual(get_min_uram_selection([10, 20], [1, 2], 0), [])
+
+    def test_infeasible(self):
+        self.assertEqual(get_min_uram_selection([10, 20], [1, 2], 100), [0, 1])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+import copy
+import random
+
+import numpy as np
+
+from fpgaconvnet.parser.Parser import Parser
+from fpgaconvnet.tools.layer_enum import LAYER_TYPE
+
+from fpgaconvnet.optimiser.latency.solvers import LatencySimulatedAnnealing
+from fpgaconvnet.optimiser.solvers.state import BlockJournal, get_attribute_state
+
+MODEL = "examples/models/lenet.onnx"
+PLATFORM = "examples/platforms/zedboard.toml"
+
+class TestBlockJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.blocks = { "a": { "exec_nodes": ["a"], "coarse": 1 },
+                "b": { "exec_nodes": ["b"], "coarse": 1 } }
+        self.original = { key: dict(block) for key, block in self.blocks.items() }
+        self.journal = BlockJournal()
+
+    def test_in_place(self):
+        # only the changed block is copied
+        self.journal.record_block(self.blocks, "a")
+        self.blocks["a"]["coarse"] = 2
+        self.assertEqual(self.original["a"]["coarse"], 1)
+        self.blocks = self.journal.rollback(self.blocks)
+        self.assertEqual(self.blocks, self.original)
+
+    def test_structural(self):
+        # blocks are added and removed, and an added block is changed
+        self.journal.record_blocks(self.blocks)
+        self.blocks["c"] = { "exec_nodes": ["a", "b"], "coarse": 1 }
+        del self.blocks["a"], self.blocks["b"]
+        self.journal.record_block(self.blocks, "c")
+        self.blocks["c"]["coarse"] = 2
+        self.blocks = self.journal.rollback(self.blocks)
+        self.assertEqual(self.blocks, self.original)
+
+    def test_clear(self):
+        # committed moves are not undone
+        self.journal.record_block(self.blocks, "a")
+        self.blocks["a"]["coarse"] = 2
+        self.journal.clear()
+        self.blocks = self.journal.rollback(self.blocks)
+        self.assertEqual(self.blocks["a"]["coarse"], 2)
+
+class TestRollback(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        np.random.seed(0)
+        net = Parser().onnx_to_fpgaconvnet(MODEL)
+        net.platform.update(PLATFORM)
+        self.opt = LatencySimulatedAnnealing(net, objective=0)
+        self.opt.undo_log = BlockJournal()
+        self.design = self.opt.get_design()
+        self.exec_node_index = dict(self.opt.exec_node_index)
+
+    def get_exec_node(self, layer_type):
+        graph = self.opt.net.graph
+        return next(node for node in graph if graph.nodes[node]["type"] == layer_type)
+
+    def apply_transform(self, transform, exec_node):
+        self.opt.apply_transform(transform, self.opt.exec_node_index[exec_node], exec_node)
+
+    def check_rollback(self):
+        self.opt.rollback()
+        # the building blocks and their index are as they were
+        self.assertEqual(self.opt.get_design(), self.design)
+        self.assertEqual(self.opt.exec_node_index, self.exec_node_index)
+        self.opt.check_exec_node_index()
+
+    def test_combine(self):
+        self.apply_transform("combine", self.get_exec_node(LAYER_TYPE.Convolution))
+        self.assertNotEqual(self.opt.building_blocks.keys(), self.design.keys())
+        self.check_rollback()
+
+    def test_seperate(self):
+        # the simple layers are combined when the solver is created
+        exec_node = next(exec_node for exec_node, hw_node in self.opt.exec_node_index.items() \
+                if len(self.opt.building_blocks[hw_node]["exec_nodes"]) > 1)
+        self.apply_transform("seperate", exec_node)
+        self.assertNotEqual(self.opt.building_blocks.keys(), self.design.keys())
+        self.check_rollback()
+
+    def test_in_place(self):
+        exec_node = self.get_exec_node(LAYER_TYPE.Convolution)
+        for transform in [ "coarse", "fine" ]:
+            self.apply_transform(transform, exec_node)
+        self.check_rollback()
+
+    def test_combine_and_change(self):
+        # changes to a block added by the same step are discarded with it
+        exec_node = self.get_exec_node(LAYER_TYPE.Convolution)
+        self.apply_transform("combine", exec_node)
+        self.apply_transform("coarse", exec_node)
+        self.apply_transform("seperate", exec_node)
+        self.check_rollback()
+
+class TestIncrementalTotals(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        np.random.seed(0)
+        net = Parser().onnx_to_fpgaconvnet(MODEL)
+        net.platform.update(PLATFORM)
+        self.opt = LatencySimulatedAnnealing(net, objective=0)
+
+    def check_totals(self):
+        # evaluate every execution node and building block of a copy, without the caches
+        opt = copy.deepcopy(self.opt)
+        opt.latency_cache, opt.latency_total = {}, 0
+        opt.resource_cache = {}
+        opt.resource_totals = dict.fromkeys(opt.resource_totals, 0)
+        opt.memory_bandwidth_cache, opt.memory_bandwidth_total = {}, 0
+        opt.evaluated_blocks = { key: {} for key in opt.evaluated_blocks }
+        opt.mark_blocks_dirty()
+        # the running totals match
+        self.assertAlmostEqual(self.opt.get_cost(), opt.get_cost())
+        resources, full_resources = self.opt.get_resources(), opt.get_resources()
+        self.assertAlmostEqual(resources.pop("MEM_BW"), full_resources.pop("MEM_BW"))
+        self.assertEqual(resources, full_resources)
+
+    def test_blocks_unchanged(self):
+        # the runtime parameters are evaluated on private copies of the layers
+        state = { hw_node: get_attribute_state(block["hw"]) \
+                for hw_node, block in self.opt.building_blocks.items() }
+        self.opt.get_cost()
+        self.assertEqual({ hw_node: get_attribute_state(block["hw"]) \
+                for hw_node, block in self.opt.building_blocks.items() }, state)
+
+    def test_transforms(self):
+        for step in range(20):
+            # apply some transforms, rejecting every other step
+            self.opt.undo_log = BlockJournal()
+            for _ in range(3):
+                transform = random.choice([ "coarse", "fine", "combine", "seperate" ])
+                hw_node = random.choice(list(self.opt.building_blocks))
+                exec_node = random.choice(list(self.opt.net.graph))
+                self.opt.apply_transform(transform, hw_node, exec_node)
+            self.opt.check_resources()
+            self.check_totals()
+            if step % 2:
+                self.opt.rollback()
+                self.check_totals()
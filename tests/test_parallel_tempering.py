@@ -0,0 +1,77 @@
+import unittest
+import copy
+import random
+from types import SimpleNamespace
+
+import numpy as np
+
+from fpgaconvnet.parser.Parser import Parser
+
+from fpgaconvnet.optimiser.solvers import ParallelTempering
+from fpgaconvnet.optimiser.solvers.parallel_tempering import init_chain, run_chain
+import fpgaconvnet.optimiser.transforms.partition as partition
+
+MODEL = "examples/models/lenet.onnx"
+PLATFORM = "examples/platforms/zedboard.toml"
+
+class Random:
+
+    def uniform(self, a, b):
+        return (a+b)/2
+
+class TestExchange(unittest.TestCase):
+
+    def setUp(self):
+        self.solver = SimpleNamespace(chains=2, k=1.0)
+
+    def test_swap(self):
+        # the colder chain has the worse design, so they always swap
+        nets, costs = ["hot", "cold"], [1.0, 5.0]
+        ParallelTempering.exchange(self.solver, Random(), [10.0, 1.0], nets, costs, 0)
+        self.assertEqual(nets, ["cold", "hot"])
+        self.assertEqual(costs, [5.0, 1.0])
+
+    def test_no_swap(self):
+        # the colder chain has the much better design, so they don't swap
+        nets, costs = ["hot", "cold"], [5.0, 1.0]
+        ParallelTempering.exchange(self.solver, Random(), [10.0, 1.0], nets, costs, 0)
+        self.assertEqual(nets, ["hot", "cold"])
+        self.assertEqual(costs, [5.0, 1.0])
+
+    def test_offset(self):
+        # only chains from the offset are paired
+        nets, costs = ["a", "b"], [1.0, 5.0]
+        ParallelTempering.exchange(self.solver, Random(), [10.0, 1.0], nets, costs, 1)
+        self.assertEqual(nets, ["a", "b"])
+
+class TestChain(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        np.random.seed(0)
+        net = Parser().onnx_to_fpgaconvnet(MODEL, PLATFORM)
+        self.opt = ParallelTempering(net)
+        self.opt.transforms = [ "coarse", "fine", "weights_reloading", "partition" ]
+        partition.split_complete(self.opt.net, None)
+        self.opt.update_partitions()
+
+    def run_chain(self):
+        # run a chain on a worker's copy of the solver
+        init_chain(copy.deepcopy(self.opt))
+        return run_chain(self.opt.get_partitions_state(), 1.0, 1234, 5)
+
+    def test_reproducible(self):
+        # two chains from the same design and seed
+        (design_a, cost_a, best_design_a, best_a, _), (design_b, cost_b, best_design_b, best_b, _) = \
+                [ self.run_chain() for _ in range(2) ]
+        self.assertEqual(design_a, design_b)
+        self.assertEqual(cost_a, cost_b)
+        self.assertEqual(best_design_a, best_design_b)
+        self.assertEqual(best_a, best_b)
+        # the cost of the chain is that of its final design
+        self.opt.set_partitions_state(design_a)
+        self.assertEqual(self.opt.get_cost(), cost_a)
+        # and the best cost is that of its best design
+        if best_design_a is not None:
+            self.opt.set_partitions_state(best_design_a)
+            self.assertEqual(self.opt.get_cost(), best_a)
@@ -0,0 +1,74 @@
+import unittest
+import copy
+import itertools
+
+from fpgaconvnet.tools.layer_enum import LAYER_TYPE
+from fpgaconvnet.optimiser.latency.solvers.utils import get_hw_from_dict, \
+        get_runtime_latency, get_runtime_latencies
+
+CONVOLUTION = {
+    "filters": 16, "rows": 16, "cols": 16, "channels": 8, "groups": 1,
+    "fine": 9, "coarse_in": 2, "coarse_out": 4, "coarse_group": 1,
+    "kernel_rows": 3, "kernel_cols": 3, "stride_rows": 1, "stride_cols": 1,
+    "pad_left": 1, "pad_right": 1, "pad_top": 1, "pad_bottom": 1,
+}
+
+POOLING = {
+    "rows": 16, "cols": 16, "channels": 8, "coarse": 4,
+    "kernel_rows": 2, "kernel_cols": 2, "stride_rows": 2, "stride_cols": 2,
+    "pad_left": 0, "pad_right": 0, "pad_top": 0, "pad_bottom": 0,
+}
+
+ELTWISE = {
+    "rows": 16, "cols": 16, "channels": 8, "ports_in": 2, "coarse": 4,
+    "op_type": "add", "broadcast": False,
+}
+
+def get_params(layer):
+    # the parameters of the layer, leaving out its modules
+    return { key: val for key, val in vars(layer).items() \
+            if isinstance(val, (bool, int, float, str, list)) }
+
+class TestRuntimeLatencies(unittest.TestCase):
+
+    def check_latencies(self, layer_type, layer, params):
+        # the rows are evaluated on a private copy of the layer
+        state = get_params(layer)
+        latencies = get_runtime_latencies(layer_type, copy.deepcopy(layer), params, 2)
+        self.assertEqual(get_params(layer), state)
+        # the latencies match evaluating each entry on the layer
+        self.assertEqual(latencies.tolist(), [ get_runtime_latency(
+            layer_type, layer, param, 2) for param in params ])
+
+    def test_convolution(self):
+        layer = get_hw_from_dict(LAYER_TYPE.Convolution, CONVOLUTION, 2)
+        # schedule entries, including repeated ones
+        params = [ { **CONVOLUTION, "rows": rows, "cols": cols,
+            "coarse_in": coarse_in, "coarse_out": coarse_out } \
+                    for rows, cols, coarse_in, coarse_out in itertools.product(
+                        [4, 16], [4, 16], [1, 2], [1, 2, 4]) ]
+        params += params[:5]
+        self.check_latencies(LAYER_TYPE.Convolution, layer, params)
+        for key in ["rows", "cols", "channels", "coarse_in", "coarse_out"]:
+            self.assertEqual(getattr(layer, key), CONVOLUTION[key])
+
+    def test_single(self):
+        layer = get_hw_from_dict(LAYER_TYPE.Convolution, CONVOLUTION, 2)
+        self.check_latencies(LAYER_TYPE.Convolution, layer, [ { **CONVOLUTION, "rows": 4 } ])
+
+    def test_pooling(self):
+        layer = get_hw_from_dict(LAYER_TYPE.Pooling, POOLING, 2)
+        params = [ { **POOLING, "rows": rows, "channels": channels, "coarse": coarse } \
+                for rows, channels, coarse in itertools.product([4, 16], [4, 8], [1, 2, 4]) ]
+        self.check_latencies(LAYER_TYPE.Pooling, layer, params)
+
+    def test_eltwise(self):
+        # the parameters of each port are stored as lists
+        layer = get_hw_from_dict(LAYER_TYPE.EltWise, ELTWISE, 2)
+        params = [ { **ELTWISE, "rows": rows, "coarse": coarse } \
+                for rows, coarse in itertools.product([4, 16], [1, 2, 4]) ]
+        self.check_latencies(LAYER_TYPE.EltWise, layer, params)
+
+    def test_empty(self):
+        layer = get_hw_from_dict(LAYER_TYPE.Convolution, CONVOLUTION, 2)
+        self.assertEqual(len(get_runtime_latencies(LAYER_TYPE.Convolution, layer, [], 2)), 0)
@@ -0,0 +1,34 @@
+import unittest
+import numpy as np
+from fpgaconvnet.optimiser.solvers.sampling import SumTree
+
+class TestSumTree(unittest.TestCase):
+
+    def test_total(self):
+        weights = [3, 0, 1, 4, 1, 5, 9, 2, 6]
+        tree = SumTree(weights)
+        self.assertEqual(tree.total(), sum(weights))
+        tree.update(6, 0)
+        self.assertEqual(tree.total(), sum(weights)-9)
+
+    def test_find(self):
+        tree = SumTree([2, 0, 3, 1, 0])
+        # each value maps to the entry covering it, skipping zero weights
+        self.assertEqual([ tree.find(value) for value in [0, 1.5, 2, 4.9, 5, 5.9] ],
+                [0, 0, 2, 2, 3, 3])
+        # values past the end map to the last entry with a non-zero weight
+        self.assertEqual(tree.find(6), 3)
+        self.assertEqual(tree.find(7), 3)
+
+    def test_sample(self):
+        np.random.seed(0)
+        tree = SumTree([1, 0, 1, 1])
+        tree.update(0, 0)
+        tree.update(3, 2)
+        counts = np.bincount([ tree.sample() for _ in range(3000) ], minlength=4)
+        self.assertEqual(counts[0], 0)
+        self.assertEqual(counts[1], 0)
+        self.assertAlmostEqual(counts[3]/counts[2], 2.0, delta=0.3)
+
+if __name__ == "__main__":
+    unittest.main()
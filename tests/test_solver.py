@@ -0,0 +1,224 @@
+import unittest
+import os
+import copy
+import json
+import pickle
+import random
+import tempfile
+from unittest import mock
+
+import numpy as np
+
+from fpgaconvnet.parser.Parser import Parser
+from fpgaconvnet.tools.layer_enum import LAYER_TYPE
+
+from fpgaconvnet.optimiser.solvers import SimulatedAnnealing
+import fpgaconvnet.optimiser.solvers.simulated_annealing as simulated_annealing
+from fpgaconvnet.optimiser.solvers.state import UndoLog, write_checkpoint, list_checkpoints
+import fpgaconvnet.optimiser.transforms.partition as partition
+from fpgaconvnet.optimiser.transforms.helper import mark_dirty
+
+MODEL = "examples/models/lenet.onnx"
+PLATFORM = "examples/platforms/zedboard.toml"
+
+def get_solver(solver=SimulatedAnnealing, **kwargs):
+    # create a completely partitioned network
+    net = Parser().onnx_to_fpgaconvnet(MODEL, PLATFORM)
+    opt = solver(net, **kwargs)
+    opt.transforms = [ "coarse", "fine", "weights_reloading", "partition" ]
+    partition.split_complete(opt.net, None)
+    opt.update_partitions()
+    return opt
+
+def get_state(opt):
+    # cost, resources and layers of the design
+    return opt.get_cost(), [ p.get_resource_usage() for p in opt.net.partitions ], \
+            [ list(p.graph.nodes) for p in opt.net.partitions ]
+
+def apply_random_moves(opt, iterations=10):
+    # apply random transforms to random nodes of the network
+    for _ in range(iterations):
+        partition_index = random.randint(0, len(opt.net.partitions)-1)
+        opt.net.partitions[partition_index].remove_squeeze()
+        mark_dirty(opt.net.partitions[partition_index])
+        node = random.choice(list(opt.net.partitions[partition_index].graph))
+        opt.apply_transform(random.choice(opt.transforms), partition_index, node)
+        opt.update_partitions()
+
+class TestUndoLog(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        np.random.seed(0)
+        self.opt = get_solver()
+
+    def test_rollback(self):
+        state = get_state(self.opt)
+        # apply some moves, and then undo them
+        self.opt.undo_log = UndoLog()
+        apply_random_moves(self.opt)
+        self.opt.undo_log.rollback(self.opt.net)
+        self.opt.update_partitions()
+        # the design is as it was before the moves
+        self.assertEqual(get_state(self.opt), state)
+
+    def test_rejected_step(self):
+        state = get_state(self.opt)
+        # run a single annealing step, and reject it
+        self.opt.T, self.opt.T_min = 1.0, 0.99
+        with mock.patch("random.uniform", return_value=2.0), \
+                mock.patch.object(self.opt, "wandb_log"):
+            self.opt.run_solver()
+        # the restored partitions are updated, with their auxiliary layers
+        self.assertTrue(all(not p.dirty for p in self.opt.net.partitions))
+        self.assertEqual(get_state(self.opt), state)
+
+class TestCandidates(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        np.random.seed(0)
+        self.opt = get_solver()
+        simulated_annealing.init_worker(pickle.dumps(copy.deepcopy(self.opt)))
+
+    def get_candidate_cost(self, seed):
+        # apply the moves of the seed to a copy of the solver
+        opt = copy.deepcopy(self.opt)
+        opt.apply_seeded_moves(seed)
+        try:
+            opt.check_resources()
+            opt.check_constraints()
+            return opt.get_cost()
+        except AssertionError:
+            return None
+
+    def test_evaluate(self):
+        state = get_state(simulated_annealing.worker_solver)
+        for seed in range(3):
+            # the worker gives the cost of the candidate, and stays at its design
+            self.assertEqual(simulated_annealing.evaluate_candidate([], seed),
+                    (seed, self.get_candidate_cost(seed)))
+            self.assertEqual(get_state(simulated_annealing.worker_solver), state)
+
+    def test_accepted_moves(self):
+        # the worker replays the accepted moves before the candidate
+        self.opt.apply_seeded_moves(1)
+        self.assertEqual(simulated_annealing.evaluate_candidate([1], 2),
+                (2, self.get_candidate_cost(2)))
+        self.assertEqual(get_state(simulated_annealing.worker_solver), get_state(self.opt))
+
+class TestIncrementalUpdate(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        np.random.seed(0)
+        self.opt = get_solver()
+
+    def get_dirty(self):
+        return [ i for i, p in enumerate(self.opt.net.partitions) if p.dirty ]
+
+    def get_node(self, partition_index, layer_type):
+        graph = self.opt.net.partitions[partition_index].graph
+        return next(node for node in graph if graph.nodes[node]["type"] == layer_type)
+
+    def test_skip_clean_partitions(self):
+        partitions = self.opt.net.partitions
+        mark_dirty(partitions[0])
+        with mock.patch.object(partitions[0], "update", wraps=partitions[0].update) as dirty, \
+                mock.patch.object(partitions[1], "update") as clean:
+            self.opt.update_partitions()
+        # only the dirty partition is updated
+        dirty.assert_called_once()
+        clean.assert_not_called()
+        self.assertEqual(self.get_dirty(), [])
+
+    def test_node_transforms(self):
+        partition_index = next(i for i, p in enumerate(self.opt.net.partitions) \
+                if any(p.graph.nodes[node]["type"] == LAYER_TYPE.Convolution for node in p.graph))
+        node = self.get_node(partition_index, LAYER_TYPE.Convolution)
+        for transform in [ "coarse", "fine", "weights_reloading" ]:
+            # the transform only flags its own partition
+            self.opt.net.partitions[partition_index].remove_squeeze()
+            self.opt.apply_transform(transform, partition_index, node)
+            self.assertEqual(self.get_dirty(), [partition_index])
+            self.opt.update_partitions()
+
+    def test_partition_transforms(self):
+        # merging flags the merged partition and its neighbours
+        for p in self.opt.net.partitions:
+            p.remove_squeeze()
+            p.dirty = False
+        partition.merge_horizontal(self.opt.net, 1, 2)
+        self.assertEqual(self.get_dirty(), [0, 1, 2])
+        for p in self.opt.net.partitions:
+            p.dirty = False
+        # splitting flags both halves and their neighbours
+        edge = partition.get_all_horizontal_splits(self.opt.net, 1)[0]
+        partition.split_horizontal(self.opt.net, 1, edge)
+        self.assertEqual(self.get_dirty(), [0, 1, 2, 3])
+
+    def test_split_independent(self):
+        for p in self.opt.net.partitions:
+            p.remove_squeeze()
+        partition.merge_horizontal(self.opt.net, 1, 2)
+        edge = partition.get_all_horizontal_splits(self.opt.net, 1)[0]
+        partition.split_horizontal(self.opt.net, 1, edge)
+        first, second = self.opt.net.partitions[1:3]
+        # the pieces share neither mutable attributes nor layers
+        for key, val in vars(first).items():
+            if isinstance(val, (list, dict, set)):
+                self.assertIsNot(val, getattr(second, key))
+        for node in first.graph:
+            if node in second.graph:
+                self.assertIsNot(first.graph.nodes[node]["hw"], second.graph.nodes[node]["hw"])
+        # changing one piece leaves the other as it was
+        state = second.get_resource_usage()
+        self.opt.apply_transform("coarse", 1, next(iter(first.graph)))
+        self.opt.update_partitions()
+        self.assertEqual(second.get_resource_usage(), state)
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        np.random.seed(0)
+        self.opt = get_solver()
+        apply_random_moves(self.opt)
+
+    def test_get_checkpoint(self):
+        graphs = [ (list(p.graph.nodes), list(p.graph.edges)) for p in self.opt.net.partitions ]
+        checkpoint = self.opt.get_checkpoint()
+        # the design is not changed by taking a checkpoint
+        self.assertEqual([ (list(p.graph.nodes), list(p.graph.edges)) \
+                for p in self.opt.net.partitions ], graphs)
+        self.assertTrue(all(not p.dirty for p in self.opt.net.partitions))
+        # auxiliary layers are not stored
+        for p in checkpoint["partitions"]:
+            for edge in p["edges"]:
+                self.assertTrue(all(node in p["nodes"] for node in edge))
+
+    def test_round_trip(self):
+        state = get_state(self.opt)
+        checkpoint = json.loads(json.dumps(self.opt.get_checkpoint()))
+        # restore the checkpoint into a solver of a new network
+        opt = get_solver()
+        opt.load_checkpoint(checkpoint)
+        self.assertEqual(get_state(opt), state)
+        self.assertEqual([ set(p.graph.edges) for p in opt.net.partitions ],
+                [ set(p.graph.edges) for p in self.opt.net.partitions ])
+        self.assertEqual(opt.T, self.opt.T)
+
+class TestWriteCheckpoint(unittest.TestCase):
+
+    def test_keep(self):
+        with tempfile.TemporaryDirectory() as path:
+            # the directory is created on the first checkpoint
+            checkpoint_path = os.path.join(path, "checkpoint")
+            paths = [ write_checkpoint(checkpoint_path, {"index": i}, keep=2) for i in range(4) ]
+            # only the newest checkpoints are kept
+            self.assertEqual(list_checkpoints(checkpoint_path), paths[-2:])
+
+    def test_keep_none(self):
+        with tempfile.TemporaryDirectory() as path:
+            with self.assertRaises(AssertionError):
+                write_checkpoint(path, {}, keep=0)